@@ -102,13 +102,18 @@ resource "aws_ecs_task_definition" "this" {
       }
 
       # prod 环境不要用 --reload，这里直接用 uvicorn 正式启动
+      # uvloop + httptools 与镜像 CMD 保持一致；worker 数用 WEB_CONCURRENCY 控制
       command = [
         "uvicorn",
         "services.api_gateway.main:app",
         "--host",
         "0.0.0.0",
         "--port",
-        tostring(var.container_port)
+        tostring(var.container_port),
+        "--loop",
+        "uvloop",
+        "--http",
+        "httptools"
       ]
     }
   ])
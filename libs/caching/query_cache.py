@@ -1,19 +1,114 @@
 # libs/caching/query_cache.py
-import hashlib
-import json
+import heapq
 import logging
 import os
+import struct
 import time
+from collections import OrderedDict
+from functools import lru_cache
 from threading import Lock
 from typing import Any
 
+import orjson
+import xxhash
+
 logger = logging.getLogger(__name__)
 
+# in-memory 回退的容量上限（条目数），防止 Redis 长时间不可用时内存无界增长
+MEM_CACHE_MAXSIZE = int(os.getenv("QUERY_CACHE_MEM_MAXSIZE", "4096"))
+
+# 分片数（必须是 2 的幂）：不同 key 落在不同分片、各自持锁，
+# 避免单把全局锁把所有缓存读写串行化
+MEM_CACHE_SHARDS = 16
+
+# make_key 的数值/布尔参数直接 pack 成 12 字节，免去 f-string 拼接
+_KEY_PARAMS_STRUCT = struct.Struct("<?iiiii?")
+
+# L1（进程内）缓存：同一 worker 上的突发重复查询不再付 Redis RTT。
+# TTL 很短，最坏情况下结果比 Redis 里的旧 5 秒
+L1_CACHE_TTL = float(os.getenv("QUERY_CACHE_L1_TTL", "5"))
+L1_CACHE_MAXSIZE = int(os.getenv("QUERY_CACHE_L1_MAXSIZE", "1024"))
+
+# 服务端一次循环完成「查存在 + 不存在则写入」：
+# 单次 RTT 替代 MGET+SETEX 两次，且并发 ingest 同一 chunk 时没有读写竞态
+_ADD_IF_ABSENT_LUA = """
+local ttl = tonumber(ARGV[1])
+local r = {}
+for i, k in ipairs(KEYS) do
+  if redis.call('EXISTS', k) == 1 then
+    r[i] = 1
+  else
+    redis.call('SET', k, 1, 'EX', ttl)
+    r[i] = 0
+  end
+end
+return r
+"""
+
 try:
     import redis  # type: ignore
 except ImportError:  # redis 包不存在时，自动走内存模式
     redis = None
 
+try:
+    # redis-py >= 5.1 才有 client-side caching（RESP3 tracking）
+    from redis.cache import CacheConfig  # type: ignore
+except ImportError:
+    CacheConfig = None
+
+
+class _MemStore:
+    """
+    in-memory 回退存储：
+    - OrderedDict 做 O(1) LRU：命中 move_to_end，超过 maxsize 淘汰最旧条目
+    - 最小堆按过期时间排序，每次读写顺手清掉真正到期的条目；
+      原先的懒惰单 key 检查会漏掉再也没人读的 entry，造成内存泄漏
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._maxsize = maxsize
+        self._lock = Lock()
+        self._store: OrderedDict[str, Any] = OrderedDict()
+        self._expire: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+
+    def _sweep(self, now: float) -> None:
+        # 只弹真正到期的堆顶，均摊 O(1)
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            ts, key = heapq.heappop(heap)
+            # set 可能刷新过同一 key 的过期时间，堆里留下的陈旧项直接跳过
+            if self._expire.get(key) == ts:
+                del self._expire[key]
+                self._store.pop(key, None)
+
+    def get(self, key: str, *, touch_ttl: float | None = None) -> Any | None:
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            if key not in self._store:
+                return None
+            self._store.move_to_end(key)
+            if touch_ttl is not None:
+                exp = now + touch_ttl
+                self._expire[key] = exp
+                heapq.heappush(self._heap, (exp, key))
+            return self._store[key]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        exp = now + ttl
+        with self._lock:
+            self._sweep(now)
+            self._store[key] = value
+            self._store.move_to_end(key)
+            self._expire[key] = exp
+            heapq.heappush(self._heap, (exp, key))
+            # LRU 淘汰：超出容量时丢掉最久未使用的
+            while len(self._store) > self._maxsize:
+                old_key, _ = self._store.popitem(last=False)
+                self._expire.pop(old_key, None)
+
 
 class QueryCache:
     """
@@ -29,16 +124,28 @@ class QueryCache:
     """
 
     def __init__(self) -> None:
-        # in-memory 备用存储
-        self._store: dict[str, Any] = {}
-        self._expire: dict[str, float] = {}
-        self._lock = Lock()
+        # in-memory 备用存储（LRU + TTL 最小堆），按 key 哈希分片
+        per_shard = max(1, MEM_CACHE_MAXSIZE // MEM_CACHE_SHARDS)
+        self._mem_shards = [
+            _MemStore(maxsize=per_shard) for _ in range(MEM_CACHE_SHARDS)
+        ]
+
+        # L1：Redis 之前再挡一层进程内 LRU（TTL 很短），
+        # 同一 worker 上的热查询命中时连 Redis RTT 都省掉
+        self._l1 = _MemStore(maxsize=L1_CACHE_MAXSIZE)
+
+        # add_if_absent 的已注册 Lua 脚本（懒初始化）
+        self._add_if_absent_script = None
 
         self._use_redis = False
         self._redis_client: redis.Redis | None = None
 
         self._init_redis()
 
+    def _mem(self, key: str) -> _MemStore:
+        # 进程内路由即可，无需稳定哈希
+        return self._mem_shards[hash(key) & (MEM_CACHE_SHARDS - 1)]
+
     def is_redis_available(self) -> bool:
         """
         用于对外暴露当前是否在使用 Redis 作为后端。
@@ -47,6 +154,28 @@ class QueryCache:
         """
         return bool(self._use_redis and self._redis_client is not None)
 
+    def cache_stats(self) -> dict[str, Any] | None:
+        """
+        client-side cache 观测入口：
+        - 返回本地缓存条目数等信息
+        - 未启用 client-side caching 时返回 None
+        """
+        if not self.is_redis_available():
+            return None
+        try:
+            local_cache = self._redis_client.get_cache()
+        except Exception:
+            return None
+        if local_cache is None:
+            return None
+        try:
+            return {
+                "size": local_cache.size,
+                "max_size": local_cache.config.get_max_size(),
+            }
+        except Exception:
+            return {"size": None, "max_size": None}
+
     # --------------------------------------------------------------
     # Redis 初始化（失败自动回退内存）
     # --------------------------------------------------------------
@@ -62,12 +191,43 @@ class QueryCache:
         db = int(os.getenv("REDIS_DB", "0"))
         password = os.getenv("REDIS_PASSWORD", None)
 
+        conn_kwargs: dict[str, Any] = {
+            "host": host,
+            "port": port,
+            "db": db,
+            "password": password,
+            # decode_responses=False：value 走 orjson 二进制编解码，
+            # 省掉 redis-py 的一次 UTF-8 decode
+            "decode_responses": False,
+            "socket_keepalive": True,
+            # 空闲连接定期探活，避免从池里拿到已断开的连接
+            "health_check_interval": 30,
+        }
+
         try:
-            client = redis.Redis(
-                host=host, port=port, db=db, password=password, decode_responses=True
-            )
-            # 测试连接
-            client.ping()
+            client = None
+
+            # 优先尝试 RESP3 + server-assisted client-side caching：
+            # 热 key 直接走本地内存，失效由服务端 push（需要 Redis >= 7.4）
+            if CacheConfig is not None:
+                try:
+                    client = self._new_client(
+                        protocol=3,
+                        cache_config=CacheConfig(max_size=10_000),
+                        **conn_kwargs,
+                    )
+                except Exception as e:
+                    logger.info(
+                        "Redis client-side caching unavailable "
+                        "(server < 7.4 or RESP3 refused), "
+                        "fallback to plain client. err=%s",
+                        e,
+                    )
+                    client = None
+
+            if client is None:
+                client = self._new_client(**conn_kwargs)
+
             self._redis_client = client
             self._use_redis = True
             logger.info(
@@ -81,9 +241,36 @@ class QueryCache:
             self._redis_client = None
 
     # --------------------------------------------------------------
-    # 生成 query 的稳定 key（sha256 + 归一化）
+    # 构造带连接池 + 探活的 Redis client
+    # --------------------------------------------------------------
+    @staticmethod
+    def _new_client(**conn_kwargs: Any) -> "redis.Redis":
+        """
+        BlockingConnectionPool 替代默认的懒惰单连接池：
+        - max_connections 限流，故障恢复时不会出现连接风暴
+        - 池子耗尽时最多阻塞 timeout 秒，而不是无限排队
+        ping 带指数退避重试，瞬时网络抖动不至于直接降级到内存模式。
+        """
+        pool = redis.BlockingConnectionPool(
+            max_connections=64, timeout=1.0, **conn_kwargs
+        )
+        client = redis.Redis(connection_pool=pool)
+
+        last_err: Exception | None = None
+        for attempt in range(3):
+            try:
+                client.ping()
+                return client
+            except Exception as e:
+                last_err = e
+                time.sleep(0.1 * (2**attempt))
+        raise last_err  # type: ignore[misc]
+
+    # --------------------------------------------------------------
+    # 生成 query 的稳定 key（xxh3 + 归一化）
     # --------------------------------------------------------------
     @staticmethod
+    @lru_cache(maxsize=4096)
     def make_key(
         q: str,
         hybrid: bool,
@@ -104,9 +291,18 @@ class QueryCache:
         - page / page_size
         - rerank
         """
-        raw = f"{q}|{hybrid}|{top_k}|{vector_k}|{bm25_k}|{page}|{page_size}|{rerank}"
-        digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
-        return f"qcache:{digest}"
+        # xxh3 比 sha256 快一个数量级，且 cache key 不需要抗碰撞强度；
+        # 前缀带版本号（v2），旧的 sha256 key 自然过期即可。
+        # 数值参数增量喂给 hasher，省掉整串 f-string + encode 的临时对象。
+        # 入参全部可哈希，lru_cache 让反复出现的热查询连哈希都不用做
+        h = xxhash.xxh3_128()
+        h.update(q.encode("utf-8"))
+        h.update(
+            _KEY_PARAMS_STRUCT.pack(
+                hybrid, top_k, vector_k, bm25_k, page, page_size, rerank
+            )
+        )
+        return "qcache:v2:" + h.hexdigest()
 
     # --------------------------------------------------------------
     # get：命中返回 dict，miss 返回 None
@@ -114,23 +310,124 @@ class QueryCache:
     def get(self, key: str) -> dict[str, Any] | None:
         # Redis 模式
         if self._use_redis and self._redis_client is not None:
+            cached = self._l1.get(key)
+            if cached is not None:
+                return cached
             try:
                 val = self._redis_client.get(key)
                 if val is None:
                     return None
-                return json.loads(val)
+                obj = orjson.loads(val)
+                self._l1.set(key, obj, L1_CACHE_TTL)
+                return obj
             except Exception as e:
                 logger.warning("QueryCache Redis get failed, key=%s, err=%s", key, e)
                 return None
 
         # in-memory 回退
-        with self._lock:
-            # 过期检查
-            if key in self._expire and time.time() > self._expire[key]:
-                self._store.pop(key, None)
-                self._expire.pop(key, None)
+        return self._mem(key).get(key)
+
+    # --------------------------------------------------------------
+    # mget：批量查 key，一次 RTT 拿回全部（miss 位置为 None）
+    # --------------------------------------------------------------
+    def mget(self, keys: list[str]) -> list[dict[str, Any] | None]:
+        if not keys:
+            return []
+
+        # Redis 模式：单条 MGET 命令，RTT 被 len(keys) 摊薄
+        if self._use_redis and self._redis_client is not None:
+            try:
+                vals = self._redis_client.mget(keys)
+                return [orjson.loads(v) if v is not None else None for v in vals]
+            except Exception as e:
+                logger.warning("QueryCache Redis mget failed, err=%s", e)
+                return [None] * len(keys)
+
+        # in-memory 回退：逐 key 复用 get 的过期逻辑
+        return [self.get(k) for k in keys]
+
+    # --------------------------------------------------------------
+    # get_touch：读取同时刷新 ttl，pipeline 合并为一次 RTT
+    # --------------------------------------------------------------
+    def get_touch(self, key: str, ttl: int = 60) -> dict[str, Any] | None:
+        if self._use_redis and self._redis_client is not None:
+            try:
+                pipe = self._redis_client.pipeline(transaction=False)
+                pipe.get(key)
+                pipe.expire(key, ttl)
+                val, _ = pipe.execute()
+                if val is None:
+                    return None
+                return orjson.loads(val)
+            except Exception as e:
+                logger.warning(
+                    "QueryCache Redis get_touch failed, key=%s, err=%s", key, e
+                )
                 return None
-            return self._store.get(key)
+
+        # in-memory 回退
+        return self._mem(key).get(key, touch_ttl=ttl)
+
+    # --------------------------------------------------------------
+    # mset：批量写入同一 ttl 的 key，pipeline 合并为一次 RTT
+    # --------------------------------------------------------------
+    def mset(self, items: dict[str, Any], ttl: int = 60) -> None:
+        if not items:
+            return
+
+        if self._use_redis and self._redis_client is not None:
+            try:
+                pipe = self._redis_client.pipeline(transaction=False)
+                for key, value in items.items():
+                    pipe.setex(key, ttl, orjson.dumps(value))
+                pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(
+                    "QueryCache Redis mset failed, err=%s; fallback to in-memory", e
+                )
+
+        # in-memory 回退
+        for key, value in items.items():
+            self._mem(key).set(key, value, ttl)
+
+    # --------------------------------------------------------------
+    # add_if_absent：批量「不存在则写入」，返回各 key 此前是否已存在
+    # --------------------------------------------------------------
+    def add_if_absent(self, keys: list[str], ttl: int = 86400) -> list[bool]:
+        """
+        ingest 去重用：一次调用检查 + 占位所有 key。
+        返回列表与 keys 对齐，True 表示 key 已存在（重复 chunk）。
+        """
+        if not keys:
+            return []
+
+        # Redis 模式：Lua 脚本在服务端原子完成，整批一个 RTT
+        if self._use_redis and self._redis_client is not None:
+            try:
+                if self._add_if_absent_script is None:
+                    self._add_if_absent_script = self._redis_client.register_script(
+                        _ADD_IF_ABSENT_LUA
+                    )
+                flags = self._add_if_absent_script(keys=keys, args=[ttl])
+                return [bool(f) for f in flags]
+            except Exception as e:
+                logger.warning(
+                    "QueryCache Redis add_if_absent failed, err=%s; "
+                    "fallback to in-memory",
+                    e,
+                )
+
+        # in-memory 回退：单进程内无并发竞态问题，逐 key 检查即可
+        out: list[bool] = []
+        for key in keys:
+            store = self._mem(key)
+            if store.get(key) is not None:
+                out.append(True)
+            else:
+                store.set(key, True, ttl)
+                out.append(False)
+        return out
 
     # --------------------------------------------------------------
     # set：写入缓存，支持 ttl（秒）
@@ -141,8 +438,10 @@ class QueryCache:
 
         # Redis 模式
         if self._use_redis and self._redis_client is not None:
+            # 写入方自己大概率马上会回读，顺手填进 L1
+            self._l1.set(key, value, min(float(ttl), L1_CACHE_TTL))
             try:
-                payload = json.dumps(value, ensure_ascii=False)
+                payload = orjson.dumps(value)
                 # setex 自带过期时间
                 self._redis_client.setex(key, ttl, payload)
                 return
@@ -157,9 +456,7 @@ class QueryCache:
                 # 不修改 self._use_redis，让它有机会再次尝试
 
         # in-memory 模式
-        with self._lock:
-            self._store[key] = value
-            self._expire[key] = time.time() + ttl
+        self._mem(key).set(key, value, ttl)
 
 
 # 单例
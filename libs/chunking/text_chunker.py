@@ -5,6 +5,8 @@ import re
 from dataclasses import dataclass
 from typing import Literal
 
+import numpy as np
+
 
 @dataclass
 class Chunk:
@@ -25,7 +27,10 @@ class TextChunker:
       overlap: 相邻chunk的重叠字符数（0 <= overlap < size）
     """
 
-    SENTENCE_SPLIT_RE = re.compile(r"(?<=[\.!\?。！？；;])\s*|\n+")
+    # 定界符直接做字符类匹配（标点串或换行串），没有 lookbehind：
+    # sre 对纯字符类走 C 级扫描，不会产生零宽匹配和回溯；
+    # 标点串整体归属前一句（group 1 的末尾就是句子边界）
+    SENTENCE_SPLIT_RE = re.compile(r"([\.!\?。！？；;]+)\s*|\n+")
 
     def __init__(
         self,
@@ -54,23 +59,70 @@ class TextChunker:
         else:
             return self._chunk_by_sentence(text, meta=meta)
 
+    def count(self, text: str) -> int:
+        """
+        只算 chunk 数，不做文本切片、不分配 Chunk 对象。
+        dry-run 预览只需要数量，大文本上省掉整份 O(N) 的字符串拷贝。
+        与 chunk() 的窗口/打包逻辑保持一致。
+        """
+        text = text or ""
+        if not text:
+            return 0
+
+        if self.strategy == "char":
+            n = len(text)
+            if n <= self.size:
+                return 1
+            # 与 _chunk_by_char 相同的窗口数：首个覆盖到末尾的窗口下标 + 1
+            step = self.size - self.overlap
+            return -(-(n - self.size) // step) + 1
+
+        # sentence 策略：同样的打包 + overlap 游走，只计数
+        sentences = self._split_sentences_with_spans(text)
+        n = len(sentences)
+        cnt = 0
+        i = 0
+        while i < n:
+            start_span = sentences[i][0]
+            end_span = sentences[i][1]
+            j = i
+            while j + 1 < n and sentences[j + 1][1] - start_span <= self.size:
+                j += 1
+                end_span = sentences[j][1]
+
+            cnt += 1
+            if j == n - 1:
+                break
+
+            desired_next_start = max(end_span - self.overlap, start_span)
+            next_i = j + 1
+            for k in range(i, j + 1):
+                if sentences[k][0] >= desired_next_start:
+                    next_i = k
+                    break
+            if next_i <= i:
+                next_i = i + 1
+            i = next_i
+
+        return cnt
+
     # ---------- strategy: char ----------
     def _chunk_by_char(self, text: str, *, meta: dict | None) -> list[Chunk]:
-        chunks: list[Chunk] = []
-
-        pos = 0
-        cid = 0
         n = len(text)
-        while pos < n:
-            end = min(pos + self.size, n)
-            chunks.append(
-                Chunk(chunk_id=cid, text=text[pos:end], start=pos, end=end, meta=meta)
-            )
-            cid += 1
-            if end == n:
-                break
-            pos = end - self.overlap
-        return chunks
+        step = self.size - self.overlap
+
+        # 一次性算出所有窗口的 (start, end)，替代逐窗口的 Python while 循环
+        starts = np.arange(0, n, step)
+        ends = np.minimum(starts + self.size, n)
+        # 第一个覆盖到文本末尾的窗口之后的都是多余窗口
+        last = int(np.searchsorted(ends, n, side="left"))
+        start_list = starts[: last + 1].tolist()
+        end_list = ends[: last + 1].tolist()
+
+        return [
+            Chunk(chunk_id=cid, text=text[s:e], start=s, end=e, meta=meta)
+            for cid, (s, e) in enumerate(zip(start_list, end_list, strict=True))
+        ]
 
     # ---------- strategy: sentence ----------
     def _split_sentences_with_spans(self, text: str) -> list[tuple[int, int, str]]:
@@ -81,20 +133,25 @@ class TextChunker:
         spans: list[tuple[int, int, str]] = []
         last = 0
         for m in self.SENTENCE_SPLIT_RE.finditer(text):
-            end = m.start()  # boundary BEFORE delimiter match
+            # 标点定界：边界在标点串之后（标点归属句子）；
+            # 换行定界：边界在换行之前
+            end = m.end(1) if m.lastindex else m.start()
             if end > last:
-                seg = text[last:end].strip()
+                raw = text[last:end]
+                seg = raw.strip()
                 if seg:
-                    # 重新定位去掉两侧空白后的精确span
-                    seg_start = text.find(seg, last, end)
+                    # 去掉两侧空白后的精确 span 直接用长度差算出来，
+                    # 不再用 text.find 做 O(len) 的重复扫描
+                    seg_start = last + (len(raw) - len(raw.lstrip()))
                     seg_end = seg_start + len(seg)
                     spans.append((seg_start, seg_end, seg))
             last = m.end()
         # tail
         if last < len(text):
-            seg = text[last:].strip()
+            raw = text[last:]
+            seg = raw.strip()
             if seg:
-                seg_start = text.find(seg, last)
+                seg_start = last + (len(raw) - len(raw.lstrip()))
                 seg_end = seg_start + len(seg)
                 spans.append((seg_start, seg_end, seg))
         # 若全为空或无分句，退化成整段
@@ -1,5 +1,6 @@
 # libs/db/milvus_client.py
 import os
+from threading import Lock
 
 import numpy as np
 from dotenv import load_dotenv
@@ -14,6 +15,29 @@ from pymilvus import (
 
 load_dotenv(override=False)
 
+# JSON 字段序列化热补丁：pymilvus 2.4 的 entity_helper 用 ujson 序列化
+# meta（每行一次 dumps），orjson 的 SIMD 路径快 3~5 倍且直接产出 bytes，
+# 与原函数 "dumps → utf-8 bytes" 的契约一致；orjson 不可用时保留原实现
+try:
+    import orjson
+    from pymilvus.client import entity_helper as _entity_helper
+
+    def _orjson_convert_to_json(obj: object) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    _entity_helper.convert_to_json = _orjson_convert_to_json
+except Exception:
+    pass
+
+# 向量存储精度（VECTOR_DTYPE 环境变量）：
+# - float32：默认，最高精度
+# - float16：Milvus 2.4+，内存带宽减半，索引构建/检索吞吐明显提升
+# int8 量化不走 schema，用 index_type=IVF_SQ8 即可（索引内部量化）
+_VECTOR_DTYPE_TO_MILVUS = {
+    "float32": DataType.FLOAT_VECTOR,
+    "float16": DataType.FLOAT16_VECTOR,
+}
+
 
 class MilvusClientFactory:
     """
@@ -23,6 +47,9 @@ class MilvusClientFactory:
     - 提供 collection 初始化 / 索引 / 加载工具
     """
 
+    # 进程内已确认建过索引的 collection（类级别，跨 factory 实例共享）
+    _indexed: set[str] = set()
+
     def __init__(self, host=None, port=None, collection_name=None):
         self.host = host or os.getenv("MILVUS_HOST", "127.0.0.1")
         self.is_zilliz = os.getenv("MILVUS_IS_ZILLIZ", "False").lower() == "true"
@@ -32,6 +59,17 @@ class MilvusClientFactory:
         self.collection_name = collection_name or os.getenv(
             "MILVUS_COLLECTION", "rag_collection"
         )
+        self.vector_dtype = os.getenv("VECTOR_DTYPE", "float32").lower()
+        if self.vector_dtype not in _VECTOR_DTYPE_TO_MILVUS:
+            raise ValueError(
+                f"Unsupported VECTOR_DTYPE={self.vector_dtype}, "
+                f"expected one of {sorted(_VECTOR_DTYPE_TO_MILVUS)}"
+            )
+
+        # Collection 句柄缓存：每次 Collection(name=...) 构造都会走一次
+        # gRPC 拉 schema，热路径上没必要重复
+        self._col_cache: dict[tuple[str, str], Collection] = {}
+        self._col_lock = Lock()
 
     # -------------------------------
     # 连接管理
@@ -53,6 +91,22 @@ class MilvusClientFactory:
             print(f"✅ Connected to Milvus at {self.host}:{self.port}")
         return True
 
+    def _get_collection(self, name=None, alias: str = "default") -> Collection:
+        """获取（并缓存）collection 句柄，避免每次查询重建 + 重拉 schema"""
+        name = name or self.collection_name
+        key = (alias, name)
+        col = self._col_cache.get(key)
+        if col is not None:
+            return col
+
+        self.connect(alias)
+        with self._col_lock:
+            col = self._col_cache.get(key)
+            if col is None:
+                col = Collection(name=name, using=alias)
+                self._col_cache[key] = col
+            return col
+
     # -------------------------------
     # Collection 初始化
     # -------------------------------
@@ -62,47 +116,79 @@ class MilvusClientFactory:
         self.connect(alias)
 
         if utility.has_collection(name, using=alias):
-            if utility.has_collection(name, using=alias):
-                col = Collection(name=name, using=alias)
-                actual_dim = col.schema.fields[1].params.get("dim")
-                if actual_dim != dim:
-                    raise ValueError(
-                        f"Existing collection '{name}' "
-                        f"dim={actual_dim} ≠ expected {dim}. "
-                        f"Please drop and recreate."
-                    )
-                return col
+            col = self._get_collection(name, alias)
+            actual_dim = col.schema.fields[1].params.get("dim")
+            if actual_dim != dim:
+                raise ValueError(
+                    f"Existing collection '{name}' "
+                    f"dim={actual_dim} ≠ expected {dim}. "
+                    f"Please drop and recreate."
+                )
+            return col
 
         fields = [
             FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=dim),
+            FieldSchema(
+                name="vector",
+                dtype=_VECTOR_DTYPE_TO_MILVUS[self.vector_dtype],
+                dim=dim,
+            ),
             FieldSchema(name="doc_id", dtype=DataType.VARCHAR, max_length=128),
             FieldSchema(name="chunk_id", dtype=DataType.INT64),
             FieldSchema(name="meta", dtype=DataType.JSON),
         ]
         schema = CollectionSchema(fields, description="RAG document chunks")
-        collection = Collection(name=name, schema=schema, using=alias)
+        # 多 shard：insert 按 shard 哈希分流到多个 DataNode 并行消费，
+        # 单 shard 时写入吞吐封顶在一个节点上（只对新建 collection 生效）
+        shards_num = int(os.getenv("MILVUS_SHARDS_NUM", "2"))
+        collection = Collection(
+            name=name, schema=schema, using=alias, shards_num=shards_num
+        )
+        with self._col_lock:
+            self._col_cache[(alias, name)] = collection
         print(f"✅ Created new collection: {name}")
         return collection
 
+    def vector_np_dtype(self) -> str:
+        """插入/检索时向量使用的 numpy dtype，与 schema 的存储精度保持一致"""
+        return "float16" if self.vector_dtype == "float16" else "float32"
+
     # -------------------------------
     # 索引 + 加载
     # -------------------------------
     def ensure_index_and_load(
         self,
         collection: Collection,
-        index_type="IVF_FLAT",
-        metric_type="L2",
+        index_type=None,
+        metric_type=None,
         nlist=128,
     ):
-        index_type = index_type or "IVF_FLAT"
+        # 默认 HNSW：查询代价 O(log N)，比 IVF_FLAT 扫 probed lists 快得多；
+        # 小集合或显式要求时仍可传 IVF_FLAT / IVF_SQ8 / GPU_CAGRA
+        index_type = index_type or os.getenv("INDEX_TYPE", "HNSW")
+        # 默认 IP：embedding 在 ingest/query 侧都已归一化
+        # （factory 固定 normalize=True），cosine 退化为一次点积，
+        # 比 L2 的平方差少一半算术量
         metric_type = metric_type or os.getenv("EMBEDDING_METRIC", "IP")
         """创建索引并加载到内存"""
+        if index_type == "HNSW":
+            build_params = {"M": 16, "efConstruction": 200}
+        elif index_type == "GPU_CAGRA":
+            build_params = {"intermediate_graph_degree": 64, "graph_degree": 32}
+        else:
+            build_params = {"nlist": nlist}
         index_params = {
             "metric_type": metric_type,
             "index_type": index_type,
-            "params": {"nlist": nlist},
+            "params": build_params,
         }
+
+        # 本进程已确认过索引的 collection 直接 load（幂等），
+        # 省掉 .indexes 的 gRPC 往返
+        if collection.name in self._indexed:
+            collection.load()
+            return index_params
+
         # 如果已存在索引则跳过
         try:
             current_indexes = collection.indexes
@@ -112,10 +198,12 @@ class MilvusClientFactory:
                 )
             else:
                 collection.create_index(field_name="vector", index_params=index_params)
+            self._indexed.add(collection.name)
         except Exception:
             # 某些版本/场景 collection.indexes 可能不可用，兜底创建
             try:
                 collection.create_index(field_name="vector", index_params=index_params)
+                self._indexed.add(collection.name)
             except Exception as inner:
                 print(f"⚠️ create_index skipped or failed: {inner}")
 
@@ -132,7 +220,11 @@ class MilvusClientFactory:
         """插入一些随机向量进行验证"""
         import numpy as np
 
-        vectors = np.random.random((num_rows, dim)).astype("float32").tolist()
+        # 直接传 ndarray：pymilvus 接受 numpy 列，省掉 .tolist()
+        # 把每个元素装箱成 Python float 的开销
+        vectors = np.random.random((num_rows, dim)).astype(
+            self.vector_np_dtype(), copy=False
+        )
         doc_ids = [f"doc_{i}" for i in range(num_rows)]
         chunk_ids = list(range(num_rows))
         metas = [{"source": "demo", "tags": ["init", "day3"]} for _ in range(num_rows)]
@@ -169,9 +261,9 @@ class MilvusClientFactory:
         except Exception as e:
             return {"status": "error", "detail": str(e)}
 
-    def search_vectors(
+    def search_vectors_batch(
         self,
-        query_vector: np.ndarray,
+        query_matrix: np.ndarray,
         top_k: int = 5,
         collection_name: str | None = None,
         metric_type: str = os.getenv("EMBEDDING_METRIC", "IP"),
@@ -180,29 +272,35 @@ class MilvusClientFactory:
         alias: str = "default",
     ):
         """
-        在指定 collection 上执行向量检索。
-        返回：List[ {doc_id, chunk_id, score, meta?} ]
+        批量向量检索：N 条 query 合并为一次 Milvus RPC。
+        Milvus 原生接受 (N, dim) 输入并共享一次图/倒排遍历的准备开销，
+        比 N 次单条 search 便宜得多。
+        返回：每条 query 一个命中列表（结构与 search_vectors 一致）。
         """
-        name = collection_name or self.collection_name
-        self.connect(alias)
-        col = Collection(name=name, using=alias)
+        col = self._get_collection(collection_name, alias)
 
         # 兼容：确保存储索引 metric 与搜索 metric 一致
         # （若不一致 Milvus 也会按索引的 metric 来）
-        search_params = {"metric_type": metric_type, "params": {"nprobe": nprobe}}
+        index_type = os.getenv("INDEX_TYPE", "HNSW").upper()
+        if index_type in ("HNSW", "GPU_CAGRA"):
+            # 图索引用 ef 控制搜索宽度；nprobe 仅对 IVF 族生效
+            params = {"ef": max(top_k * 2, 64)}
+        else:
+            params = {"nprobe": nprobe}
+        search_params = {"metric_type": metric_type, "params": params}
         output_fields = output_fields or ["doc_id", "chunk_id", "meta"]
 
-        if not isinstance(query_vector, np.ndarray):
-            query_vector = np.asarray(query_vector, dtype="float32")
-        if query_vector.dtype != np.float32:
-            query_vector = query_vector.astype("float32")
-
-        # Milvus 要求二维数组：[ [dim], [dim], ... ]
-        data = [query_vector.tolist()]
+        np_dtype = self.vector_np_dtype()
+        query_matrix = np.asarray(query_matrix)
+        if query_matrix.ndim == 1:
+            # Milvus 要求二维输入；reshape 是零拷贝视图
+            query_matrix = query_matrix.reshape(1, -1)
+        if query_matrix.dtype != np.dtype(np_dtype):
+            query_matrix = query_matrix.astype(np_dtype)
 
         try:
             res = col.search(
-                data=data,
+                data=query_matrix,
                 anns_field="vector",
                 param=search_params,
                 limit=top_k,
@@ -210,25 +308,51 @@ class MilvusClientFactory:
             )
         except Exception as e:
             print(f"❌ Milvus search error: {e}")
-            return [{"error": str(e)}]
+            return [[{"error": str(e)}] for _ in range(len(query_matrix))]
 
-        hits = []
-        # res[0] 是第一个查询向量的命中列表
-        for hit in res[0]:
-            item = {
-                "score": hit.distance,
-            }
-            # 命中实体字段
-            try:
-                # 新版 PyMilvus 建议通过 entity.get()
-                for f in output_fields:
-                    item[f] = hit.entity.get(f)
-            except Exception:
-                # 旧版可能用 ._entity 或 .id 等，这里保持容错
-                pass
-            hits.append(item)
+        all_hits = []
+        for per_query in res:
+            hits = []
+            # entity 取一次局部变量 + 字典推导一次性建 dict，
+            # 省掉逐字段的重复属性查找
+            for hit in per_query:
+                try:
+                    entity = hit.entity
+                    item = {
+                        "score": hit.distance,
+                        **{f: entity.get(f) for f in output_fields},
+                    }
+                except Exception:
+                    # 旧版可能用 ._entity 或 .id 等，这里保持容错，只带 score
+                    item = {"score": hit.distance}
+                hits.append(item)
+            all_hits.append(hits)
 
-        return hits
+        return all_hits
+
+    def search_vectors(
+        self,
+        query_vector: np.ndarray,
+        top_k: int = 5,
+        collection_name: str | None = None,
+        metric_type: str = os.getenv("EMBEDDING_METRIC", "IP"),
+        nprobe: int = 8,
+        output_fields: list[str] | None = None,
+        alias: str = "default",
+    ):
+        """
+        在指定 collection 上执行单条向量检索（batch 版的薄封装）。
+        返回：List[ {doc_id, chunk_id, score, meta?} ]
+        """
+        return self.search_vectors_batch(
+            query_vector,
+            top_k=top_k,
+            collection_name=collection_name,
+            metric_type=metric_type,
+            nprobe=nprobe,
+            output_fields=output_fields,
+            alias=alias,
+        )[0]
 
     def fetch_all_documents(self, alias: str = "default"):
         """
@@ -236,8 +360,7 @@ class MilvusClientFactory:
         只返回 meta 字段用于 BM25 构造 corpus。
         （注意：建议仅在 corpus 构建或重建时调用）
         """
-        self.connect(alias)
-        col = Collection(name=self.collection_name, using=alias)
+        col = self._get_collection(alias=alias)
 
         # Milvus 查询不能直接用 ""，必须用 "id >= 0" 或 " " 作为 filter
         try:
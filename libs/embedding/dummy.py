@@ -1,7 +1,6 @@
 # libs/embedding/dummy.py
-import hashlib
-
 import numpy as np
+import xxhash
 
 from libs.embedding.base import BaseEmbeddingModel
 
@@ -22,9 +21,37 @@ class DummyEmbeddingModel(BaseEmbeddingModel):
         return v
 
     def embed_one(self, text: str):
-        h = hashlib.sha256(text.encode("utf-8")).digest()
-        seed = int.from_bytes(h[:8], "little")
+        # 只是要 8 字节确定性种子，xxh3 比 sha256 便宜几个数量级
+        seed = xxhash.xxh3_64_intdigest(text.encode("utf-8"))
         rng = np.random.default_rng(seed)
 
-        vec = rng.normal(loc=0.0, scale=1.0, size=self.dim).astype("float32")
+        # float32 原生采样：不再生成 float64 临时数组后 astype 拷贝，
+        # 采样吞吐翻倍、内存减半（与 embed_batch 的生成路径保持一致）
+        vec = rng.standard_normal(self.dim, dtype=np.float32)
         return self._normalize_vec(vec)
+
+    def embed_batch(self, texts: list[str]) -> list[np.ndarray]:
+        """
+        批量版：每行仍用自己的 text 种子采样，随机数与 embed_one 逐 bit 一致
+        （ingest / query 两条路径必须对得上）；
+        归一化合并为一次 (B, dim) 矩阵运算，省掉逐向量的 norm 调用，
+        与单条路径的差异仅在 float32 舍入（~1e-8），对检索无影响。
+        """
+        if not texts:
+            return []
+
+        mat = np.empty((len(texts), self.dim), dtype="float32")
+        # float32 原生采样直接写进预分配矩阵的行：无 float64 临时、无 astype 拷贝
+        _intdigest = xxhash.xxh3_64_intdigest
+        _rng = np.random.default_rng
+        for i, t in enumerate(texts):
+            _rng(_intdigest(t.encode("utf-8"))).standard_normal(
+                self.dim, dtype=np.float32, out=mat[i]
+            )
+
+        if self.normalize:
+            norms = np.linalg.norm(mat, axis=1, keepdims=True)
+            norms[norms == 0.0] = 1.0
+            mat /= norms
+
+        return list(mat)
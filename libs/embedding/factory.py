@@ -1,13 +1,18 @@
 # libs/embedding/factory.py
 import os
+from functools import lru_cache
 
 from libs.embedding.base import BaseEmbeddingModel
 
 
+@lru_cache(maxsize=1)
 def get_embedding_model() -> BaseEmbeddingModel:
     """
     根据 .env 中的 EMBEDDING_MODEL 动态选择 embedding 模型。
     支持：dummy / sentence / openai
+
+    模型配置在进程生命周期内不变，缓存单例即可；
+    worker 每个任务都会调用一次，不必重复读 env + 构造。
     """
     model_name = os.getenv("EMBEDDING_MODEL", "dummy").lower()
     dim = int(os.getenv("EMBEDDING_DIM", "768"))
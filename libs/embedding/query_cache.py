@@ -0,0 +1,20 @@
+# libs/embedding/query_cache.py
+from functools import lru_cache
+
+import numpy as np
+
+from libs.embedding.factory import get_embedding_model
+
+
+@lru_cache(maxsize=4096)
+def embed_query_cached(query: str) -> np.ndarray:
+    """
+    按 query 文本缓存的 embedding，检索与 rerank 两侧共用：
+    hybrid + rerank 的一次请求里同一个 query 会被 embed 两次，
+    热查询（监控探针、自动补全、仪表盘轮询）跨请求也高度重复。
+    只缓存 embedding 而非检索结果：Milvus 数据会更新，结果不可长期缓存。
+    模型由 get_embedding_model() 以进程生命周期单例提供（换模型要重启进程），
+    因此无需在 key 里掺模型标识。
+    返回的 ndarray 是共享只读对象，调用方要拷贝后再修改。
+    """
+    return get_embedding_model().embed_one(query)
@@ -1,10 +1,17 @@
-import json
+import atexit
 import os
+import queue
 import sqlite3
-from datetime import datetime, timezone
-from threading import Lock
+import threading
+import time
+from collections import deque
 from typing import Any
 
+import orjson
+import zstandard as zstd
+
+from libs.logging.structured_logger import _fast_iso_now
+
 # --------------------------------------------------------------------
 # 目录初始化
 # --------------------------------------------------------------------
@@ -21,37 +28,179 @@ DB_FILE = os.path.join(DB_DIR, "query_logs.db")
 
 
 # --------------------------------------------------------------------
-# SQLite 初始化（包含自动建表）
+# SQLite 初始化：进程级长连接 + WAL
+#   - 原先每条日志 connect/commit/close 一次，连接建立和逐条 fsync 占大头
+#   - WAL + synchronous=NORMAL 把 commit 成本降一个量级，且读写不互斥
+#   - 连接只被下面的后台写线程访问，因此不再需要全局锁
 # --------------------------------------------------------------------
-_sqlite_lock = Lock()
+_conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+_conn.execute("PRAGMA journal_mode=WAL")
+_conn.execute("PRAGMA synchronous=NORMAL")
+_conn.execute("PRAGMA busy_timeout=5000")
+_conn.execute("PRAGMA temp_store=MEMORY")
 
 
 def _init_sqlite():
-    with _sqlite_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS query_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                trace_id TEXT,
-                query TEXT,
-                hybrid INTEGER,
-                top_k INTEGER,
-                latency REAL,
-                result_count INTEGER,
-                payload TEXT,
-                created_at TEXT
-            );
+    _conn.execute(
         """
-        )
-        conn.commit()
-        conn.close()
+        CREATE TABLE IF NOT EXISTS query_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trace_id TEXT,
+            query TEXT,
+            hybrid INTEGER,
+            top_k INTEGER,
+            latency REAL,
+            result_count INTEGER,
+            payload BLOB,
+            created_at TEXT
+        );
+    """
+    )
 
 
 # 初始化数据库
 _init_sqlite()
 
+# --------------------------------------------------------------------
+# 后台批量写线程：请求线程只负责入队，唯一的写线程攒批提交
+# --------------------------------------------------------------------
+_write_queue: "queue.Queue[tuple]" = queue.Queue(maxsize=10_000)
+_BATCH_MAX_ROWS = 500
+_BATCH_MAX_WAIT_S = 0.1
+
+# 模块级常量：同一字符串对象反复传入，sqlite3 的语句缓存可以
+# 直接复用编译好的 prepared statement，不用每次重新 parse SQL
+_INSERT_SQL = """
+    INSERT INTO query_logs (
+        trace_id, query, hybrid, top_k,
+        latency, result_count, payload, created_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# payload 落库前做 zstd 压缩（典型 hybrid 结果能缩 3-5 倍，WAL I/O 同比减少）。
+# ZstdCompressor 不是线程安全的，所以压缩放在唯一的后台写线程里做，
+# 顺带把这点 CPU 也挪出了请求热路径。
+_ZSTD = zstd.ZstdCompressor(level=3)
+
+
+def _write_rows(rows: list[tuple]) -> None:
+    try:
+        # row[6] 是 orjson 序列化后的 payload bytes，入库前统一压缩
+        rows = [(*r[:6], _ZSTD.compress(r[6]), r[7]) for r in rows]
+        _conn.execute("BEGIN IMMEDIATE")
+        # executemany 一条编译好的语句吃掉整批，免去逐行 execute 的开销
+        _conn.executemany(_INSERT_SQL, rows)
+        _conn.execute("COMMIT")
+    except Exception as e:
+        try:
+            _conn.execute("ROLLBACK")
+        except Exception:
+            pass
+        print(f"[QueryLogger] sqlite batch insert failed: {e}")
+
+
+def _sqlite_writer_loop() -> None:
+    while True:
+        rows = [_write_queue.get()]
+        # 攒批：最多等 _BATCH_MAX_WAIT_S 或攒够 _BATCH_MAX_ROWS
+        deadline = time.monotonic() + _BATCH_MAX_WAIT_S
+        while len(rows) < _BATCH_MAX_ROWS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(_write_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        _write_rows(rows)
+
+
+_writer_thread = threading.Thread(
+    target=_sqlite_writer_loop, name="query-log-sqlite-writer", daemon=True
+)
+_writer_thread.start()
+
+
+def _flush_pending() -> None:
+    """进程退出时尽量把还在队列里的记录落库（best effort）"""
+    rows: list[tuple] = []
+    while True:
+        try:
+            rows.append(_write_queue.get_nowait())
+        except queue.Empty:
+            break
+    if rows:
+        _write_rows(rows)
+
+
+atexit.register(_flush_pending)
+
+
+# --------------------------------------------------------------------
+# 后台文件写入器：请求线程只入队，消费线程攒批落盘
+# --------------------------------------------------------------------
+class _LogWriter:
+    """
+    多生产者单消费者的日志写入器：
+      - enqueue 只是 deque.append（CPython 下原子，无锁）
+      - 后台线程每 50ms 醒一次（或积攒超过 64KB 时被叫醒），
+        把队列一次性排空，合并成一次 write() 落到常开的 fd 上
+      - 替代原先每条日志 open/write/close 的同步写法
+    """
+
+    FLUSH_INTERVAL_S = 0.05
+    FLUSH_THRESHOLD_BYTES = 64 * 1024
+    # writev 单次最多 IOV_MAX 个 iovec，超出要分段提交
+    _IOV_MAX = 1024
+
+    def __init__(self, path: str):
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._buf: deque[bytes] = deque()
+        # 近似计数，只用于触发提前 flush，不要求精确
+        self._pending_bytes = 0
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(
+            target=self._loop, name="query-log-file-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def enqueue(self, line: bytes) -> None:
+        self._buf.append(line)
+        self._pending_bytes += len(line)
+        if self._pending_bytes >= self.FLUSH_THRESHOLD_BYTES:
+            self._wakeup.set()
+
+    def _loop(self) -> None:
+        while True:
+            self._wakeup.wait(timeout=self.FLUSH_INTERVAL_S)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        buf = self._buf
+        if not buf:
+            return
+        chunks: list[bytes] = []
+        while True:
+            try:
+                chunks.append(buf.popleft())
+            except IndexError:
+                break
+        self._pending_bytes = 0
+        try:
+            if hasattr(os, "writev"):
+                # writev 把一批日志行零拷贝地交给内核，
+                # 省掉 b"".join 为合并写分配的大块中间缓冲
+                for i in range(0, len(chunks), self._IOV_MAX):
+                    os.writev(self._fd, chunks[i : i + self._IOV_MAX])
+            else:
+                # 非 POSIX 平台退回合并后单次 write
+                os.write(self._fd, b"".join(chunks))
+        except Exception as e:
+            print(f"[QueryLogger] Failed to flush log file: {e}")
+
 
 # --------------------------------------------------------------------
 # Query Logger
@@ -66,63 +215,49 @@ class QueryLogger:
     def __init__(self, log_file: str = LOG_FILE, db_file: str = DB_FILE):
         self.log_file = log_file
         self.db_file = db_file
+        self._writer = _LogWriter(log_file)
 
     # --------------------------------------------------------------
     # 写 JSON 行日志
     # --------------------------------------------------------------
     def log_to_file(self, record: dict[str, Any]) -> None:
         try:
-            with open(self.log_file, "a", encoding="utf-8") as f:
-                json.dump(record, f, ensure_ascii=False)
-                f.write("\n")
+            # orjson 直接产出 UTF-8 bytes；热路径只做序列化 + 入队
+            self._writer.enqueue(orjson.dumps(record) + b"\n")
         except Exception as e:
-            print(f"[QueryLogger] Failed to write log file: {e}")
+            print(f"[QueryLogger] Failed to enqueue file log: {e}")
 
     # --------------------------------------------------------------
     # 写 SQLite
     # --------------------------------------------------------------
     def log_to_sqlite(self, record: dict[str, Any]) -> None:
+        # 请求线程只做序列化 + 入队；压缩和 INSERT 都由后台线程批量完成
         try:
-            payload = json.dumps(record, ensure_ascii=False)
-            with _sqlite_lock:
-                conn = sqlite3.connect(self.db_file)
-                cur = conn.cursor()
-                cur.execute(
-                    """
-                    INSERT INTO query_logs (
-                        trace_id,
-                        query,
-                        hybrid,
-                        top_k,
-                        latency,
-                        result_count,
-                        payload,
-                        created_at
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        record.get("trace_id"),
-                        record.get("query"),
-                        int(record.get("hybrid", False)),
-                        record.get("top_k"),
-                        record.get("latency_ms"),
-                        record.get("result_count"),
-                        payload,
-                        record.get("timestamp"),
-                    ),
-                )
-                conn.commit()
-                conn.close()
+            payload = orjson.dumps(record)
+            row = (
+                record.get("trace_id"),
+                record.get("query"),
+                int(record.get("hybrid", False)),
+                record.get("top_k"),
+                record.get("latency_ms"),
+                record.get("result_count"),
+                payload,
+                record.get("timestamp"),
+            )
+            _write_queue.put_nowait(row)
+        except queue.Full:
+            print("[QueryLogger] sqlite write queue full, dropping record")
         except Exception as e:
-            print(f"[QueryLogger] Failed to insert sqlite log: {e}")
+            print(f"[QueryLogger] Failed to enqueue sqlite log: {e}")
 
     # --------------------------------------------------------------
     # 对外统一接口
     # --------------------------------------------------------------
     def log(self, record: dict[str, Any]) -> None:
         if "timestamp" not in record:
-            record["timestamp"] = datetime.now(tz=timezone.utc).isoformat()
+            # 复用 structured_logger 的缓存式格式化，
+            # 免去每条日志的 datetime 构造 + isoformat
+            record["timestamp"] = _fast_iso_now()
 
         self.log_to_file(record)
         self.log_to_sqlite(record)
@@ -1,6 +1,27 @@
 # libs/retriever/rrf.py
 from typing import Any
 
+import numpy as np
+
+# 按 k 缓存的贡献表：默认 k=60 且 top_k 不大，表只会在首个请求时算一次
+_RRF_CACHE: dict[int, list[float]] = {}
+
+# 来源只有两种，用 bit 标记替代 list 的线性扫描
+_SOURCE_BITS = (("vector", 1), ("bm25", 2))
+
+
+def _rrf_contributions(n: int, k: int) -> list[float]:
+    """取 rank=1..n 的 1/(k+rank)，表按 k 懒加载并按需扩容"""
+    if n <= 0:
+        return []
+    table = _RRF_CACHE.get(k)
+    if table is None or len(table) < n:
+        size = max(n, 1024)
+        # tolist 一次性转成 Python float，比在循环里逐元素取 ndarray 标量快
+        table = np.reciprocal(np.arange(1, size + 1, dtype=np.float64) + k).tolist()
+        _RRF_CACHE[k] = table
+    return table[:n]
+
 
 def _build_key(hit: dict[str, Any], source: str, idx: int) -> str:
     """
@@ -16,19 +37,18 @@ def _build_key(hit: dict[str, Any], source: str, idx: int) -> str:
     return f"{source}:{idx}"
 
 
+# 空 dict 常量：meta 缺失时复用，避免每个命中分配一个新 dict
+_EMPTY: dict[str, Any] = {}
+
+
 def _extract_text_from_vector_hit(hit: dict[str, Any]) -> str | None:
     """
     vector 命中通常来自 Milvus，text 可能藏在 meta 里。
+    meta 由我们自己的命中构造产出，只会是 dict 或 None。
     """
     # 有些情况下上层已经把 text 展开成 hit["text"]
-    if "text" in hit and hit["text"]:
-        return hit["text"]
-
-    meta = hit.get("meta") or {}
-    if isinstance(meta, dict):
-        return meta.get("text") or meta.get("content")
-
-    return None
+    meta = hit.get("meta") or _EMPTY
+    return hit.get("text") or meta.get("text") or meta.get("content")
 
 
 def rrf_fuse(
@@ -49,18 +69,32 @@ def rrf_fuse(
             score_vector, score_bm25,
             rrf_score, sources
     """
-    fused: dict[str, dict[str, Any]] = {}
+    # SoA（结构数组）融合状态：key 只映射到行号，
+    # 分数走并行数组（排序时可直接交给 numpy），文本等元数据走并行 list。
+    # 相比每个候选建一个 7 键 dict，省内存且排序无需逐元素回调。
+    key_to_idx: dict[str, int] = {}
+    rrf_scores: list[float] = []
+    vec_scores: list[float | None] = []
+    bm25_scores: list[float | None] = []
+    doc_ids: list[Any] = []
+    chunk_ids: list[Any] = []
+    texts: list[str | None] = []
+    src_masks: list[int] = []
 
     def add_results(
         results: list[dict[str, Any]], source: str, is_vector: bool
     ) -> None:
-        for rank, hit in enumerate(results, start=1):
+        src_bit = 1 if is_vector else 2
+        contribs = _rrf_contributions(len(results), k)
+        pairs = zip(results, contribs, strict=True)
+        for rank, (hit, contribution) in enumerate(pairs, start=1):
             key = _build_key(hit, source, rank)
 
-            if key not in fused:
-                # 初始化一条融合结果
-                doc_id = hit.get("doc_id")
-                chunk_id = hit.get("chunk_id")
+            idx = key_to_idx.get(key)
+            if idx is None:
+                # 新候选：追加一行
+                idx = len(rrf_scores)
+                key_to_idx[key] = idx
 
                 if is_vector:
                     text = _extract_text_from_vector_hit(hit)
@@ -68,21 +102,24 @@ def rrf_fuse(
                     # BM25 一般直接有 text
                     text = hit.get("text")
 
-                fused[key] = {
-                    "doc_id": doc_id,
-                    "chunk_id": chunk_id,
-                    "text": text,
-                    "score_vector": None,
-                    "score_bm25": None,
-                    "rrf_score": 0.0,
-                    "sources": [],
-                }
-
-            entry = fused[key]
+                doc_ids.append(hit.get("doc_id"))
+                chunk_ids.append(hit.get("chunk_id"))
+                texts.append(text)
+                vec_scores.append(None)
+                bm25_scores.append(None)
+                rrf_scores.append(0.0)
+                src_masks.append(0)
+            elif texts[idx] is None:
+                # 合并命中：text 本身按引用共享（list 存的是字符串引用，
+                # 不会复制大段 chunk 文本），只在首次命中没取到 text 时
+                # 才用另一路的命中补全，其余情况跳过重复提取
+                if is_vector:
+                    texts[idx] = _extract_text_from_vector_hit(hit)
+                else:
+                    texts[idx] = hit.get("text")
 
-            # 记录来源
-            if source not in entry["sources"]:
-                entry["sources"].append(source)
+            # 记录来源（按位或天然幂等，无需查重）
+            src_masks[idx] |= src_bit
 
             # 记录原始 score
             raw_score = hit.get("score")
@@ -93,19 +130,29 @@ def rrf_fuse(
                     raw_score = None
 
             if is_vector and raw_score is not None:
-                entry["score_vector"] = raw_score
+                vec_scores[idx] = raw_score
             elif (not is_vector) and raw_score is not None:
-                entry["score_bm25"] = raw_score
+                bm25_scores[idx] = raw_score
 
-            # RRF 增量
-            contribution = 1.0 / (k + rank)
-            entry["rrf_score"] += contribution
+            # RRF 增量（contribution 已在循环外批量算好）
+            rrf_scores[idx] += contribution
 
     # 先加 vector 再加 bm25，这样优先用向量结果补全 doc_id/text 等字段
     add_results(vector_results or [], source="vector", is_vector=True)
     add_results(bm25_results or [], source="bm25", is_vector=False)
 
-    # 转为 list 并按 rrf_score 降序排序
-    fused_list = list(fused.values())
-    fused_list.sort(key=lambda x: x["rrf_score"], reverse=True)
-    return fused_list
+    # 按 rrf_score 降序：取负后做稳定 argsort，
+    # 同分时保持插入顺序（与原先 list.sort(reverse=True) 一致）
+    order = np.argsort(-np.asarray(rrf_scores, dtype=np.float64), kind="stable")
+    return [
+        {
+            "doc_id": doc_ids[i],
+            "chunk_id": chunk_ids[i],
+            "text": texts[i],
+            "score_vector": vec_scores[i],
+            "score_bm25": bm25_scores[i],
+            "rrf_score": rrf_scores[i],
+            "sources": [s for s, b in _SOURCE_BITS if src_masks[i] & b],
+        }
+        for i in order.tolist()
+    ]
@@ -23,9 +23,11 @@ import time
 import json
 import random
 import statistics
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import matplotlib.pyplot as plt
+import numpy as np
 import requests
 
 # ================================
@@ -38,6 +40,8 @@ API_URL = os.getenv(
 )
 
 RUNS_PER_CASE = int(os.getenv("HYBRID_RUNS", "30"))
+# 并发请求数；默认 1 保持原来的串行行为（CI 用）
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "1"))
 TOP_K_LIST = [5, 10, 20]
 
 OUT_DIR = Path("benchmarks/ai")
@@ -58,90 +62,111 @@ QUERIES = [
     "vector similarity",
 ]
 
+# 常驻 Session + keep-alive：连接跨请求复用，
+# 测出来的延迟不再混入每次的 TCP（/TLS）握手
+SESSION = requests.Session()
+_adapter = requests.adapters.HTTPAdapter(
+    pool_connections=max(8, CONCURRENCY),
+    pool_maxsize=max(8, CONCURRENCY),
+    max_retries=0,
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
 # ================================
-# Helpers
+# Single case
 # ================================
 
 
-def p50(values):
-    return statistics.median(values)
+def _build_params(top_k: int):
+    """计时括号外预先采样 query、构造 params，不污染测量值"""
+    q = random.choice(QUERIES)
+    params = {
+        "q": q,
+        "top_k": top_k,
+        "hybrid": True,
+        "vector_k": top_k,
+        "bm25_k": top_k,
+        "rerank": False,
+        "page": 1,
+        "page_size": top_k,
+        "debug": False,
+    }
+    return q, params
+
 
+def _one_request(q: str, params: dict):
+    """发一次请求，返回 (query, latency_ms | None, status, wall_ms)"""
+    # perf_counter_ns 单调且高精度，不受系统时钟回拨和浮点相减舍入影响
+    t0 = time.perf_counter_ns()
+    resp = SESSION.get(API_URL, params=params, timeout=10)
+    wall_elapsed_ms = (time.perf_counter_ns() - t0) / 1e6
 
-def p95(values):
-    values_sorted = sorted(values)
-    idx = max(0, int(len(values_sorted) * 0.95) - 1)
-    return values_sorted[idx]
+    if resp.status_code != 200:
+        return q, None, resp.status_code, wall_elapsed_ms
 
+    data = resp.json()
+    # 优先使用服务端的 total latency（毫秒）
+    server_latency = None
+    if isinstance(data, dict):
+        latency_dict = data.get("latency_ms") or {}
+        server_latency = latency_dict.get("total")
 
-# ================================
-# Single case
-# ================================
+    latency_ms = (
+        float(server_latency) if server_latency is not None else wall_elapsed_ms
+    )
+    return q, latency_ms, resp.status_code, wall_elapsed_ms
 
 
 def run_single_case(top_k: int):
     latencies = []
     errors = 0
 
-    print(f"\n🚀 [Hybrid] top_k={top_k} ... running {RUNS_PER_CASE} times")
-
-    for i in range(RUNS_PER_CASE):
-        q = random.choice(QUERIES)
-
-        params = {
-            "q": q,
-            "top_k": top_k,
-            "hybrid": True,
-            "vector_k": top_k,
-            "bm25_k": top_k,
-            "rerank": False,
-            "page": 1,
-            "page_size": top_k,
-            "debug": False,
-        }
-
-        try:
-            t0 = time.time()
-            resp = requests.get(API_URL, params=params, timeout=10)
-            wall_elapsed_ms = (time.time() - t0) * 1000.0
-
-            if resp.status_code != 200:
+    print(
+        f"\n🚀 [Hybrid] top_k={top_k} ... running {RUNS_PER_CASE} times "
+        f"(concurrency={CONCURRENCY})"
+    )
+
+    # 并发发请求：采样总时长从 Σ latency 降到 ≈ max latency，
+    # 同样时间内可以跑更大的 N
+    jobs = [_build_params(top_k) for _ in range(RUNS_PER_CASE)]
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as ex:
+        futures = [ex.submit(_one_request, q, params) for q, params in jobs]
+
+        for i, fut in enumerate(as_completed(futures), start=1):
+            try:
+                q, latency_ms, status, wall_elapsed_ms = fut.result()
+            except Exception as e:
+                errors += 1
+                print(f"[{i:02d}] ERROR: {e}")
+                continue
+
+            if latency_ms is None:
                 errors += 1
                 print(
-                    f"[{i+1:02d}] {q:<35} ERROR status={resp.status_code} "
+                    f"[{i:02d}] {q:<35} ERROR status={status} "
                     f"({wall_elapsed_ms:7.2f} ms)"
                 )
                 continue
 
-            data = resp.json()
-            # 优先使用服务端的 total latency（毫秒）
-            server_latency = None
-            if isinstance(data, dict):
-                latency_dict = data.get("latency_ms") or {}
-                server_latency = latency_dict.get("total")
-
-            latency_ms = (
-                float(server_latency) if server_latency is not None else wall_elapsed_ms
-            )
             latencies.append(latency_ms)
-
-            print(
-                f"[{i+1:02d}] {q:<35} {latency_ms:7.2f} ms "
-                f"(status={resp.status_code})"
-            )
-
-        except Exception as e:
-            errors += 1
-            print(f"[{i+1:02d}] ERROR: {e}")
+            print(f"[{i:02d}] {q:<35} {latency_ms:7.2f} ms (status={status})")
 
     if not latencies:
         return None
 
+    # 线性插值分位数：小 N 下稳定无偏，
+    # 替代原来 int(len*0.95)-1 的截断取法（N<11 时会退化成取 0）
+    p50_ms, p95_ms, p99_ms = np.quantile(latencies, [0.5, 0.95, 0.99])
+
     result = {
         "top_k": top_k,
         "runs": RUNS_PER_CASE,
         "errors": errors,
-        "p50_ms": round(p50(latencies), 2),
-        "p95_ms": round(p95(latencies), 2),
+        "p50_ms": round(p50_ms, 2),
+        "p95_ms": round(p95_ms, 2),
+        "p99_ms": round(p99_ms, 2),
         "mean_ms": round(statistics.mean(latencies), 2),
         "std_ms": round(statistics.pstdev(latencies), 2),
         "raw_latencies_ms": latencies,
@@ -19,6 +19,8 @@ import statistics
 import random
 import requests
 import matplotlib.pyplot as plt
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # ================================
@@ -31,6 +33,8 @@ API_URL = os.getenv(
 )
 
 RUNS_PER_CASE = int(os.getenv("RUNS", "30"))
+# 并发请求数；默认 1 保持原来的串行行为（CI 用）
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "1"))
 TOP_K_LIST = [5, 10, 20]
 
 OUT_DIR = Path("benchmarks/ai")
@@ -51,60 +55,75 @@ QUERIES = [
     "vector similarity",
 ]
 
-# ================================
-# Helper
-# ================================
-
-
-def p50(values):
-    return statistics.median(values)
-
-
-def p95(values):
-    values_sorted = sorted(values)
-    idx = max(0, int(len(values_sorted) * 0.95) - 1)
-    return values_sorted[idx]
-
+# 常驻 Session + keep-alive：连接跨请求复用，
+# 测出来的延迟不再混入每次的 TCP（/TLS）握手
+SESSION = requests.Session()
+_adapter = requests.adapters.HTTPAdapter(
+    pool_connections=max(8, CONCURRENCY),
+    pool_maxsize=max(8, CONCURRENCY),
+    max_retries=0,
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
 
 # ================================
 # Single benchmark run
 # ================================
 
 
+def _one_request(q: str, params: dict):
+    """发一次请求，返回 (query, latency_ms, status)"""
+    # perf_counter_ns 单调且高精度，不受系统时钟回拨和浮点相减舍入影响
+    t0 = time.perf_counter_ns()
+    resp = SESSION.get(API_URL, params=params, timeout=10)
+    elapsed = (time.perf_counter_ns() - t0) / 1e6  # ms
+    return q, elapsed, resp.status_code
+
+
 def run_single_case(top_k: int):
     latencies = []
     errors = 0
 
-    print(f"\n🚀 [Vector] top_k={top_k} ... running {RUNS_PER_CASE} times")
-
-    for i in range(RUNS_PER_CASE):
-        q = random.choice(QUERIES)
+    print(
+        f"\n🚀 [Vector] top_k={top_k} ... running {RUNS_PER_CASE} times "
+        f"(concurrency={CONCURRENCY})"
+    )
+
+    # 计时括号外预先采样 query、构造 params，不污染测量值
+    jobs = [
+        (q, {"q": q, "top_k": top_k, "hybrid": False})
+        for q in (random.choice(QUERIES) for _ in range(RUNS_PER_CASE))
+    ]
+
+    # 并发发请求：采样总时长从 Σ latency 降到 ≈ max latency
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as ex:
+        futures = [ex.submit(_one_request, q, params) for q, params in jobs]
+
+        for i, fut in enumerate(as_completed(futures), start=1):
+            try:
+                q, elapsed, status = fut.result()
+            except Exception as e:
+                errors += 1
+                print(f"[{i:02d}] ERROR: {e}")
+                continue
 
-        try:
-            t0 = time.time()
-            resp = requests.get(
-                API_URL,
-                params={"q": q, "top_k": top_k, "hybrid": False},
-                timeout=10,
-            )
-            elapsed = (time.time() - t0) * 1000  # ms
             latencies.append(elapsed)
-
-            print(f"[{i+1:02d}] {q:<35} {elapsed:7.2f} ms  status={resp.status_code}")
-
-        except Exception as e:
-            errors += 1
-            print(f"[{i+1:02d}] ERROR: {e}")
+            print(f"[{i:02d}] {q:<35} {elapsed:7.2f} ms  status={status}")
 
     if not latencies:
         return None
 
+    # 线性插值分位数：小 N 下稳定无偏，
+    # 替代原来 int(len*0.95)-1 的截断取法（N<11 时会退化成取 0）
+    p50_ms, p95_ms, p99_ms = np.quantile(latencies, [0.5, 0.95, 0.99])
+
     result = {
         "top_k": top_k,
         "runs": RUNS_PER_CASE,
         "errors": errors,
-        "p50_ms": round(p50(latencies), 2),
-        "p95_ms": round(p95(latencies), 2),
+        "p50_ms": round(p50_ms, 2),
+        "p95_ms": round(p95_ms, 2),
+        "p99_ms": round(p99_ms, 2),
         "mean_ms": round(statistics.mean(latencies), 2),
         "std_ms": round(statistics.pstdev(latencies), 2),
         "raw_latencies_ms": latencies,
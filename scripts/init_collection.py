@@ -5,9 +5,10 @@ from libs.db.milvus_client import MilvusClientFactory
 def init_collection():
     factory = MilvusClientFactory()
     collection = factory.get_or_create_collection(name="rag_collection", dim=768)
-    factory.ensure_index_and_load(
-        collection, index_type="IVF_FLAT", metric_type="IP", nlist=128
-    )
+    # 不再显式传 index_type：索引类型统一由 INDEX_TYPE 环境变量决定
+    # （默认 HNSW），保证与查询侧按同一变量推导的 search params 匹配，
+    # 避免 IVF 索引配上 HNSW 的 ef 参数
+    factory.ensure_index_and_load(collection)
     factory.insert_demo_data(collection)
     print("✅ Collection initialization complete.")
 
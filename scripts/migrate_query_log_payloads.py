@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+一次性迁移：把 query_logs.payload 里的明文 JSON 重编码为 zstd 压缩 BLOB。
+
+新写入的日志已经是压缩 BLOB，本脚本只处理历史 TEXT 行，可安全重复执行：
+  python -m scripts.migrate_query_log_payloads
+"""
+
+import sqlite3
+
+import zstandard as zstd
+
+from libs.logging.query_logger import DB_FILE
+
+
+def main():
+    conn = sqlite3.connect(DB_FILE)
+    compressor = zstd.ZstdCompressor(level=3)
+
+    rows = conn.execute("SELECT id, payload FROM query_logs").fetchall()
+    # 只重编码还是 TEXT 的历史行；已压缩的行读出来是 bytes，直接跳过
+    updates = [
+        (compressor.compress(payload.encode("utf-8")), row_id)
+        for row_id, payload in rows
+        if isinstance(payload, str)
+    ]
+
+    if updates:
+        conn.executemany("UPDATE query_logs SET payload = ? WHERE id = ?", updates)
+        conn.commit()
+
+    conn.close()
+    print(f"✅ Re-encoded {len(updates)}/{len(rows)} rows in {DB_FILE}")
+
+
+if __name__ == "__main__":
+    main()
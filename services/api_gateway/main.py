@@ -1,628 +1,825 @@
-# services/api_gateway/main.py
-from __future__ import annotations
-
-import os
-import time
-import uuid
-from datetime import datetime, timezone
-from typing import Any, Literal
-
-from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, HTTPException, Query, Request
-
-# --- OpenTelemetry Tracing ---
-from opentelemetry import trace
-from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
-from pydantic import BaseModel, Field, HttpUrl
-
-from libs.caching.query_cache import query_cache
-from libs.db.milvus_client import MilvusClientFactory
-from libs.logging.query_logger import query_logger
-from libs.logging.structured_logger import logger  # 新增
-from services.retriever.bm25_retriever import BM25Retriever
-from services.retriever.hybrid_retriever import HybridRetriever
-from services.retriever.vector_retriever import VectorRetriever
-
-load_dotenv(override=False)
-# -----------------------------------------------------------------------------
-# FastAPI app
-# -----------------------------------------------------------------------------
-# --- OpenTelemetry Tracer Init ---
-provider = TracerProvider()
-processor = BatchSpanProcessor(ConsoleSpanExporter())
-provider.add_span_processor(processor)
-trace.set_tracer_provider(provider)
-otel_tracer = trace.get_tracer("rag-api-gateway")
-app = FastAPI(title="RAG API Gateway", version="0.0.4")
-
-# ---------------------------------------------------------------------
-# API Key Authentication (Day 25)
-# ---------------------------------------------------------------------
-API_GATEWAY_TOKEN = os.getenv("API_GATEWAY_TOKEN")
-
-
-def require_api_key(request: Request):
-    if not API_GATEWAY_TOKEN:
-        return  # 如果未配置 token，则默认关闭鉴权（方便本地）
-    key = request.headers.get("X-API-Key")
-    if key != API_GATEWAY_TOKEN:
-        raise HTTPException(status_code=401, detail="Invalid API Key")
-
-
-@app.middleware("http")
-async def inject_trace_id(request: Request, call_next):
-    """
-    统一注入 trace_id / correlation_id：
-      - 优先使用上游传来的 X-Trace-Id / X-Correlation-Id
-      - 否则从 OpenTelemetry span 生成 / 随机生成
-    """
-    # 1) 从 header 读取
-    header_trace_id = request.headers.get("X-Trace-Id") or request.headers.get(
-        "X-Trace-ID"
-    )
-    correlation_id = request.headers.get("X-Correlation-Id")
-
-    # 2) 如果没有，就从 OTEL span 里拿一个；再不行就 uuid4
-    if header_trace_id:
-        trace_id = header_trace_id
-    else:
-        span = trace.get_current_span()
-        span_ctx = span.get_span_context()
-        if span_ctx and span_ctx.trace_id:
-            trace_id = format(span_ctx.trace_id, "032x")
-        else:
-            trace_id = uuid.uuid4().hex
-
-    # 放到 request.state，后面 handler / libs 都能拿到
-    request.state.trace_id = trace_id
-    request.state.correlation_id = correlation_id
-
-    response = await call_next(request)
-    response.headers["X-Trace-Id"] = trace_id
-    if correlation_id:
-        response.headers["X-Correlation-Id"] = correlation_id
-    return response
-
-
-FastAPIInstrumentor.instrument_app(app)
-
-
-vector_retriever = VectorRetriever()
-hybrid_retriever = HybridRetriever()
-bm25_retriever = BM25Retriever()
-
-
-# -----------------------------------------------------------------------------
-# Health Check （原逻辑保留）
-# -----------------------------------------------------------------------------
-@app.get("/health")
-def health_check():
-    factory = MilvusClientFactory()
-    return factory.health_status()
-
-
-# -----------------------------------------------------------------------------
-# Ingest 契约定义
-# -----------------------------------------------------------------------------
-class ChunkParams(BaseModel):
-    strategy: Literal["char", "sentence"] = "sentence"
-    size: int = Field(800, ge=1)
-    overlap: int = Field(100, ge=0)
-
-    def validate_logic(self) -> None:
-        if self.overlap >= self.size:
-            raise ValueError("overlap must be < size")
-
-
-class IngestRequest(BaseModel):
-    text: str | None = Field(None, description="原始文本（可选；与 file_url 二选一）")
-    file_url: HttpUrl | None = Field(
-        None, description="文件地址（可选；与 text 二选一）"
-    )
-    metadata: dict[str, Any] | None = Field(default=None)
-    source_id: str | None = None
-    chunk: ChunkParams = Field(default_factory=ChunkParams)
-
-    def ensure_payload(self) -> None:
-        if not self.text and not self.file_url:
-            raise ValueError("Either 'text' or 'file_url' must be provided.")
-        self.chunk.validate_logic()
-
-
-class IngestAck(BaseModel):
-    task_id: str
-    accepted_at: str
-    payload_kind: Literal["text", "file_url"]
-    chunk_params: ChunkParams
-    preview_chunks: int | None = None
-    note: str | None = None
-
-
-# -----------------------------------------------------------------------------
-# Ingest 接口
-# -----------------------------------------------------------------------------
-@app.post("/ingest", response_model=IngestAck)
-def ingest(
-    payload: IngestRequest,
-    request: Request,
-    api_ok: None = Depends(require_api_key),
-    dry_run: bool = Query(True, description="仅校验/预览，不入库/不入队"),
-):
-    try:
-        payload.ensure_payload()
-    except ValueError as e:
-        raise HTTPException(status_code=422, detail=str(e)) from e
-
-    task_id = str(uuid.uuid4())
-    kind: Literal["text", "file_url"] = "text" if payload.text else "file_url"
-
-    # 打日志方便追踪
-    trace_id = getattr(request.state, "trace_id", None)
-    correlation_id = getattr(request.state, "correlation_id", None)
-
-    logger.info(
-        "INGEST_ACCEPTED",
-        trace_id=trace_id,
-        correlation_id=correlation_id,
-        extra={
-            "task_id": task_id,
-            "kind": kind,
-            "chunk": {
-                "strategy": payload.chunk.strategy,
-                "size": payload.chunk.size,
-                "overlap": payload.chunk.overlap,
-            },
-            "source_id": payload.source_id,
-            "dry_run": dry_run,
-        },
-    )
-
-    ack = IngestAck(
-        task_id=task_id,
-        accepted_at=datetime.now(tz=timezone.utc).isoformat(),
-        payload_kind=kind,
-        chunk_params=payload.chunk,
-        note="Accepted and validated. Queueing will be implemented on Day 6.",
-    )
-
-    # dry_run 模式：直接调用 chunker 预估分片数
-    if dry_run:
-        if payload.text:
-            try:
-                from libs.chunking.text_chunker import TextChunker
-
-                chunker = TextChunker(
-                    strategy=payload.chunk.strategy,
-                    size=payload.chunk.size,
-                    overlap=payload.chunk.overlap,
-                )
-                chunks = chunker.chunk(payload.text, meta=payload.metadata)
-                ack.preview_chunks = len(chunks)
-                ack.note = "Dry run only. No Milvus insert."
-            except Exception as e:
-                logger.exception(
-                    "INGEST_DRY_RUN_CHUNK_FAILED",
-                    trace_id=trace_id,
-                    correlation_id=correlation_id,
-                    extra={"error": str(e)},
-                )
-
-        return ack
-    # ---------------------------------------------------------------------
-    # dry_run == False → 真正的 ingest 流程
-    # ---------------------------------------------------------------------
-    # 1) 获取文本（支持 file_url）
-    if payload.text:
-        text = payload.text
-    else:
-        import requests
-
-        try:
-            r = requests.get(payload.file_url, timeout=10)
-            r.raise_for_status()
-            text = r.text
-        except Exception as e:
-            raise HTTPException(
-                status_code=502, detail=f"Failed to download file_url: {e}"
-            ) from e
-
-    # 2) 调用 Worker 执行 chunk → embed → milvus insert
-    try:
-        from libs.chunking.text_chunker import TextChunker
-
-        chunker = TextChunker(
-            strategy=payload.chunk.strategy,
-            size=payload.chunk.size,
-            overlap=payload.chunk.overlap,
-        )
-        chunks = chunker.chunk(text, meta=payload.metadata)
-
-        import hashlib
-
-        def h(s: str) -> str:
-            return hashlib.md5(s.encode("utf-8")).hexdigest()
-
-        cached_flags = []
-        dedup_chunks = []
-        for c in chunks:
-            ck = f"chunk:{h(c.text)}"
-            if query_cache.get(ck):
-                cached_flags.append(True)
-            else:
-                cached_flags.append(False)
-                dedup_chunks.append(c)
-                query_cache.set(ck, True, ttl=24 * 3600)  # 24h 避免重复写入
-
-        # 3) 调用 Worker 处理去重后的 chunks
-        from services.embedding_worker.worker import process_document_incremental
-
-        inserted = process_document_incremental(
-            doc_id=task_id,
-            chunks=dedup_chunks,
-            metadata=payload.metadata,
-        )
-    except Exception as e:
-        logger.exception(
-            "INGEST_PROCESSING_FAILED",
-            trace_id=trace_id,
-            correlation_id=correlation_id,
-            extra={
-                "task_id": task_id,
-                "error": str(e),
-            },
-        )
-        raise HTTPException(status_code=500, detail=f"Ingest failed: {e}") from e
-
-    ack.preview_chunks = inserted
-    ack.note = f"Inserted {inserted} chunks into Milvus."
-    return ack
-
-
-# -----------------------------------------------------------------------------
-# Query 接口：向量检索（统一 DummyEmbeddingModel）
-# -----------------------------------------------------------------------------
-@app.get("/query")
-def query_endpoint(
-    request: Request,
-    api_ok: None = Depends(require_api_key),
-    q: str = Query(..., description="查询文本"),
-    top_k: int = Query(5, ge=1, le=20),
-    hybrid: bool = Query(False, description="是否使用 hybrid 检索"),
-    vector_k: int = 5,
-    bm25_k: int = 5,
-    rerank: bool = Query(False, description="是否启用 rerank（仅 hybrid 模式）"),
-    page: int = Query(1, ge=1, le=1_000_000),
-    page_size: int = Query(10, ge=1, le=50),
-    debug: bool = Query(False, description="是否返回调试信息（仅 hybrid 模式生效）"),
-):
-    """
-    支持 hybrid 检索：
-    - hybrid=false: 仅向量检索（Milvus）
-    - hybrid=true: vector + BM25 (+ RRF + 可选 Rerank)
-    Day23: 增加 Milvus/Redis 故障降级能力：
-      - Milvus 故障 -> 自动降级为 BM25-only
-      - Redis 缓存不可用 -> 自动回退内存缓存，标记 redis_ok=False
-    """
-
-    trace_id = getattr(request.state, "trace_id", str(uuid.uuid4()))
-    correlation_id = getattr(request.state, "correlation_id", None)
-    t_start = time.time()
-
-    # -----------------------------------------------------
-    # 降级/健康状态标记
-    # -----------------------------------------------------
-    milvus_ok = True
-    degraded = False
-    degraded_mode: str | None = None
-    degraded_reason: str | None = None
-
-    # Redis 状态
-    try:
-        redis_ok = query_cache.is_redis_available()
-    except Exception:
-        redis_ok = True  # 没这个方法就当作 True
-
-    # -----------------------------------------------------
-    # 缓存处理
-    #   - debug=True 时：完全绕过缓存（不读不写）
-    #   - 降级结果不写入缓存（避免缓存住故障状态）
-    # -----------------------------------------------------
-    cache_key: str | None = None
-    cached: dict[str, Any] | None = None
-
-    if not debug and redis_ok:
-        cache_key = query_cache.make_key(
-            q,
-            hybrid,
-            top_k,
-            vector_k,
-            bm25_k,
-            page,
-            page_size,
-            rerank,
-        )
-        cached = query_cache.get(cache_key)
-
-    if cached:
-        # 给缓存结果补充 trace_id / cache_hit / 健康信息
-        cached["trace_id"] = trace_id
-        cached["cache_hit"] = True
-        cached.setdefault("degraded", False)
-        cached.setdefault("degraded_mode", None)
-        cached.setdefault("degraded_reason", None)
-        cached.setdefault("milvus_ok", True)
-        cached.setdefault("redis_ok", redis_ok)
-
-        query_logger.log(
-            {
-                "trace_id": trace_id,
-                "query": q,
-                "hybrid": hybrid,
-                "top_k": top_k,
-                "latency_ms": 0,
-                "result_count": len(cached.get("results", [])),
-                "cache_hit": True,
-                "degraded": cached.get("degraded", False),
-                "milvus_ok": cached.get("milvus_ok"),
-                "redis_ok": cached.get("redis_ok"),
-                "degraded_reason": cached.get("degraded_reason"),
-                "timestamp": datetime.now(tz=timezone.utc).isoformat(),
-            }
-        )
-
-        logger.info(
-            "QUERY_CACHE_HIT",
-            trace_id=trace_id,
-            correlation_id=correlation_id,
-            extra={
-                "query": q,
-                "hybrid": hybrid,
-                "top_k": top_k,
-                "result_count": len(cached.get("results", [])),
-            },
-        )
-
-        return cached
-
-    # -----------------------------------------------------
-    # 缓存 miss → 执行真实检索
-    # -----------------------------------------------------
-    if not hybrid:
-        # =================================================
-        # 分支一：纯向量检索（带 Milvus 降级）
-        # =================================================
-        try:
-            t0 = time.time()
-            res = vector_retriever.search(q, top_k)
-            t1 = time.time()
-
-            raw_hits = res.get("results", [])
-            formatted: list[dict[str, Any]] = []
-
-            for hit in raw_hits:
-                text = hit.get("text")
-                meta = hit.get("meta") or {}
-                if not text and isinstance(meta, dict):
-                    text = meta.get("text") or meta.get("content")
-
-                item: dict[str, Any] = {
-                    "doc_id": hit.get("doc_id"),
-                    "chunk_id": hit.get("chunk_id"),
-                    "text": text,
-                    "score_vector": float(hit["score"]) if "score" in hit else None,
-                    "score_bm25": None,
-                    "rrf_score": None,
-                    "sources": ["vector"],
-                }
-                if "error" in hit:
-                    item["error"] = hit["error"]
-
-                formatted.append(item)
-
-            latency_ms = {
-                "vector": round((t1 - t0) * 1000, 2),
-                "total": round((t1 - t_start) * 1000, 2),
-            }
-
-            response: dict[str, Any] = {
-                "trace_id": trace_id,
-                "cache_hit": False,
-                "query": q,
-                "hybrid": False,
-                "top_k": top_k,
-                "latency_ms": latency_ms,
-                "results": formatted,
-            }
-
-        except Exception as e:
-            # -----------------------------
-            # Milvus 故障 → 降级为 BM25-only
-            # -----------------------------
-            milvus_ok = False
-            degraded = True
-            degraded_mode = "bm25_only"
-            degraded_reason = f"vector_search_failed: {e}"
-
-            t_bm0 = time.time()
-            bm25_hits = bm25_retriever.search(q, top_k)
-            t_bm1 = time.time()
-
-            formatted: list[dict[str, Any]] = []
-            for hit in bm25_hits:
-                formatted.append(
-                    {
-                        "doc_id": None,
-                        "chunk_id": hit.get("chunk_id"),
-                        "text": hit.get("text"),
-                        "score_vector": None,
-                        "score_bm25": float(hit["score"]) if "score" in hit else None,
-                        "rrf_score": None,
-                        "sources": ["bm25"],
-                    }
-                )
-
-            latency_ms = {
-                "vector": 0.0,
-                "bm25": round((t_bm1 - t_bm0) * 1000, 2),
-                "total": round((t_bm1 - t_start) * 1000, 2),
-            }
-
-            response = {
-                "trace_id": trace_id,
-                "cache_hit": False,
-                "query": q,
-                "hybrid": False,
-                "top_k": top_k,
-                "latency_ms": latency_ms,
-                "results": formatted,
-            }
-
-    else:
-        # =================================================
-        # 分支二：Hybrid 检索（向量 + BM25 + RRF）
-        # 若内部出现 Milvus 错误，同样降级为 BM25-only
-        # =================================================
-        try:
-            res = hybrid_retriever.search(
-                query=q,
-                vector_k=vector_k,
-                bm25_k=bm25_k,
-                top_k=top_k,
-                rerank=rerank,
-                page=page,
-                page_size=page_size,
-                debug=debug,
-            )
-
-            response = {
-                "trace_id": trace_id,
-                "cache_hit": False,
-                "query": q,
-                "hybrid": True,
-                "top_k": top_k,
-                "vector_k": vector_k,
-                "bm25_k": bm25_k,
-                "rerank": rerank,
-                "latency_ms": res.get("latency_ms", {}),
-                "pagination": res.get("pagination"),
-                "results": res.get("final_results") or res.get("fused_results", []),
-            }
-
-            if debug:
-                response["debug"] = res.get("debug")
-
-        except Exception as e:
-            # -----------------------------
-            # Hybrid 内部异常（通常是 Milvus）→ BM25-only
-            # -----------------------------
-            milvus_ok = False
-            degraded = True
-            degraded_mode = "bm25_only"
-            degraded_reason = f"hybrid_search_failed: {e}"
-
-            t_bm0 = time.time()
-            bm25_hits = bm25_retriever.search(q, top_k)
-            t_bm1 = time.time()
-
-            formatted: list[dict[str, Any]] = []
-            for hit in bm25_hits:
-                formatted.append(
-                    {
-                        "doc_id": None,
-                        "chunk_id": hit.get("chunk_id"),
-                        "text": hit.get("text"),
-                        "score_vector": None,
-                        "score_bm25": float(hit["score"]) if "score" in hit else None,
-                        "rrf_score": None,
-                        "sources": ["bm25"],
-                    }
-                )
-
-            latency_ms = {
-                "bm25": round((t_bm1 - t_bm0) * 1000, 2),
-                "total": round((t_bm1 - t_start) * 1000, 2),
-            }
-
-            response = {
-                "trace_id": trace_id,
-                "cache_hit": False,
-                "query": q,
-                "hybrid": True,
-                "top_k": top_k,
-                "vector_k": vector_k,
-                "bm25_k": top_k,
-                "rerank": False,
-                "latency_ms": latency_ms,
-                "pagination": {
-                    "page": 1,
-                    "page_size": len(formatted) or page_size,
-                    "total": len(formatted),
-                },
-                "results": formatted,
-            }
-
-    # -----------------------------------------------------
-    # 补充降级 & 健康元信息
-    # -----------------------------------------------------
-    response["degraded"] = degraded
-    response["degraded_mode"] = degraded_mode
-    response["degraded_reason"] = degraded_reason
-    response["milvus_ok"] = milvus_ok
-    response["redis_ok"] = redis_ok
-
-    # -----------------------------------------------------
-    # 写入缓存（debug=True / degraded=True 不写；空结果也不写）
-    # -----------------------------------------------------
-    if (
-        not debug
-        and cache_key
-        and response.get("results")
-        and not response.get("degraded", False)
-    ):
-        # Day 12 约定：短期缓存 30s
-        query_cache.set(cache_key, response, ttl=30)
-
-    # -----------------------------------------------------
-    # 写入日志（文件 + SQLite）
-    # -----------------------------------------------------
-    query_logger.log(
-        {
-            "trace_id": trace_id,
-            "query": q,
-            "hybrid": hybrid,
-            "top_k": top_k,
-            "latency_ms": response.get("latency_ms", {}).get("total", None),
-            "result_count": len(response.get("results", [])),
-            "cache_hit": False,
-            "degraded": degraded,
-            "degraded_mode": degraded_mode,
-            "degraded_reason": degraded_reason,
-            "milvus_ok": milvus_ok,
-            "redis_ok": redis_ok,
-            "payload": response,
-        }
-    )
-
-    logger.info(
-        "QUERY_EXECUTED",
-        trace_id=trace_id,
-        correlation_id=correlation_id,
-        extra={
-            "query": q,
-            "hybrid": hybrid,
-            "top_k": top_k,
-            "latency_ms": response.get("latency_ms", {}),
-            "result_count": len(response.get("results", [])),
-            "degraded": degraded,
-            "degraded_mode": degraded_mode,
-            "milvus_ok": milvus_ok,
-            "redis_ok": redis_ok,
-        },
-    )
-
-    return response
-
-
-# test2
+# services/api_gateway/main.py
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, Literal
+
+import httpx
+import numpy as np
+import xxhash
+from dotenv import load_dotenv
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
+
+# --- OpenTelemetry Tracing ---
+from opentelemetry import trace
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl, model_validator
+
+from libs.caching.query_cache import query_cache
+from libs.chunking.text_chunker import TextChunker
+from libs.db.milvus_client import MilvusClientFactory
+from libs.embedding.factory import get_embedding_model
+from libs.logging.query_logger import query_logger
+from libs.logging.structured_logger import _fast_iso_now, logger  # 新增
+from services.embedding_worker.worker import process_document_incremental
+from services.retriever.bm25_retriever import BM25Retriever
+from services.retriever.hybrid_retriever import HybridRetriever
+from services.retriever.vector_retriever import VectorRetriever
+
+load_dotenv(override=False)
+# -----------------------------------------------------------------------------
+# FastAPI app
+# -----------------------------------------------------------------------------
+# --- OpenTelemetry Tracer Init ---
+# ConsoleSpanExporter 会在请求路径里同步把每个 span 序列化到 stdout，
+# 高 QPS 下 stdout 锁本身就是瓶颈。默认不导出；
+# OTEL_ENABLED=1 时走 OTLP gRPC + 按高吞吐调参的批处理器
+OTEL_ENABLED = bool(os.getenv("OTEL_ENABLED"))
+
+provider = TracerProvider()
+if OTEL_ENABLED:
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+    exporter = OTLPSpanExporter(
+        endpoint=os.getenv("OTEL_ENDPOINT", "localhost:4317"),
+        insecure=True,
+    )
+    provider.add_span_processor(
+        BatchSpanProcessor(
+            exporter,
+            max_queue_size=8192,
+            max_export_batch_size=512,
+            schedule_delay_millis=500,
+        )
+    )
+trace.set_tracer_provider(provider)
+otel_tracer = trace.get_tracer("rag-api-gateway")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 常驻 HTTP 客户端：跨请求复用连接池，随应用生命周期创建/关闭；
+    # keep-alive 连接重复抓同源 file_url 时省掉 TCP/TLS 握手
+    app.state.http = httpx.AsyncClient(
+        timeout=10,
+        limits=httpx.Limits(max_keepalive_connections=32),
+    )
+
+    # 预热：重模块随顶层 import 已加载，这里再把惰性构造的对象焐热，
+    # 首个请求不付 chunker/embedding 的冷启动成本
+    try:
+        _chunker("sentence", 800, 100)
+        get_embedding_model().embed_one("warmup")
+    except Exception as e:
+        logger.warning("STARTUP_WARMUP_FAILED", extra={"error": str(e)})
+
+    # 可选：WARMUP_QUERY=1 时预打一发向量检索，提前建立 Milvus 连接；
+    # 默认关闭，避免 Milvus 未就绪时拖慢启动/就绪探针
+    if os.getenv("WARMUP_QUERY"):
+        try:
+            await asyncio.to_thread(vector_retriever.search, "warmup", 1)
+        except Exception as e:
+            logger.warning("STARTUP_WARMUP_QUERY_FAILED", extra={"error": str(e)})
+
+    yield
+    await app.state.http.aclose()
+
+
+# orjson 序列化大结果集比 stdlib json 快数倍，作为全局默认响应类
+app = FastAPI(
+    title="RAG API Gateway",
+    version="0.0.4",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
+
+# ---------------------------------------------------------------------
+# API Key Authentication (Day 25)
+# ---------------------------------------------------------------------
+API_GATEWAY_TOKEN = os.getenv("API_GATEWAY_TOKEN")
+
+# /ingest 下载 file_url 的内容上限（按解码后的字符数计）
+INGEST_MAX_FILE_CHARS = int(os.getenv("INGEST_MAX_FILE_CHARS", str(50 * 1024 * 1024)))
+
+
+# trace_id/task_id 只需要 128bit 不可预测的十六进制串，不需要 UUID 语义；
+# 一次 urandom 批量切出 256 个 ID，把每请求一次的 getrandom 系统调用摊薄掉
+_id_pool: deque[str] = deque()
+
+
+def _new_id() -> str:
+    if not _id_pool:
+        buf = os.urandom(16 * 256)
+        _id_pool.extend(buf[i : i + 16].hex() for i in range(0, len(buf), 16))
+    return _id_pool.popleft()
+
+
+def require_api_key(request: Request):
+    if not API_GATEWAY_TOKEN:
+        return  # 如果未配置 token，则默认关闭鉴权（方便本地）
+    key = request.headers.get("X-API-Key")
+    if key != API_GATEWAY_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+
+@app.middleware("http")
+async def inject_trace_id(request: Request, call_next):
+    """
+    统一注入 trace_id / correlation_id：
+      - 优先使用上游传来的 X-Trace-Id / X-Correlation-Id
+      - 否则从 OpenTelemetry span 生成 / 随机生成
+    """
+    # 1) 从 header 读取
+    header_trace_id = request.headers.get("X-Trace-Id") or request.headers.get(
+        "X-Trace-ID"
+    )
+    correlation_id = request.headers.get("X-Correlation-Id")
+
+    # 2) 如果没有，就从 OTEL span 里拿一个；再不行就从 ID 池取
+    if header_trace_id:
+        trace_id = header_trace_id
+    else:
+        span = trace.get_current_span()
+        span_ctx = span.get_span_context()
+        if span_ctx and span_ctx.trace_id:
+            trace_id = format(span_ctx.trace_id, "032x")
+        else:
+            trace_id = _new_id()
+
+    # 放到 request.state，后面 handler / libs 都能拿到
+    request.state.trace_id = trace_id
+    request.state.correlation_id = correlation_id
+
+    response = await call_next(request)
+    response.headers["X-Trace-Id"] = trace_id
+    if correlation_id:
+        response.headers["X-Correlation-Id"] = correlation_id
+    return response
+
+
+# 自动埋点本身有每请求开销，与导出器一起用同一个开关控制
+if OTEL_ENABLED:
+    FastAPIInstrumentor.instrument_app(app)
+
+
+vector_retriever = VectorRetriever()
+hybrid_retriever = HybridRetriever()
+bm25_retriever = BM25Retriever()
+
+# 模块级单例：/health 每次新建 factory 会重复做配置解析和对象分配，
+# 检索路径的 retriever 们也各自持有自己的长生命周期实例
+_milvus_factory = MilvusClientFactory()
+
+# 命中格式化用的共享常量：每个 hit 不再重建 list/dict
+_VEC_SOURCES = ("vector",)
+_BM25_SOURCES = ("bm25",)
+_EMPTY_META: dict[str, Any] = {}
+
+
+def _format_bm25_fallback(bm25_hits: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Milvus 降级路径的命中格式化，与向量分支一样走单个推导式"""
+    return [
+        {
+            "doc_id": None,
+            "chunk_id": hit.get("chunk_id"),
+            "text": hit.get("text"),
+            "score_vector": None,
+            "score_bm25": float(hit["score"]) if "score" in hit else None,
+            "rrf_score": None,
+            "sources": _BM25_SOURCES,
+        }
+        for hit in bm25_hits
+    ]
+
+
+@lru_cache(maxsize=64)
+def _chunker(strategy: str, size: int, overlap: int) -> TextChunker:
+    """chunk 参数空间有限，按参数缓存实例，省掉每次 /ingest 的构造"""
+    return TextChunker(strategy=strategy, size=size, overlap=overlap)
+
+
+# -----------------------------------------------------------------------------
+# Health Check （原逻辑保留）
+# -----------------------------------------------------------------------------
+@app.get("/health")
+def health_check():
+    return _milvus_factory.health_status()
+
+
+# -----------------------------------------------------------------------------
+# Ingest 契约定义
+# -----------------------------------------------------------------------------
+# extra='forbid' + frozen：校验走 pydantic-core 预编译的 rust schema 快路径，
+# 未知字段直接拒绝，也不用为可变性做防御检查
+class ChunkParams(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+    strategy: Literal["char", "sentence"] = "sentence"
+    size: int = Field(800, ge=1)
+    overlap: int = Field(100, ge=0)
+
+    @model_validator(mode="after")
+    def validate_logic(self) -> ChunkParams:
+        if self.overlap >= self.size:
+            raise ValueError("overlap must be < size")
+        return self
+
+
+class IngestRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+    text: str | None = Field(None, description="原始文本（可选；与 file_url 二选一）")
+    file_url: HttpUrl | None = Field(
+        None, description="文件地址（可选；与 text 二选一）"
+    )
+    metadata: dict[str, Any] | None = Field(default=None)
+    source_id: str | None = None
+    chunk: ChunkParams = Field(default_factory=ChunkParams)
+
+    @model_validator(mode="after")
+    def ensure_payload(self) -> IngestRequest:
+        if not self.text and not self.file_url:
+            raise ValueError("Either 'text' or 'file_url' must be provided.")
+        return self
+
+
+class IngestAck(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+    task_id: str
+    accepted_at: str
+    payload_kind: Literal["text", "file_url"]
+    chunk_params: ChunkParams
+    preview_chunks: int | None = None
+    note: str | None = None
+
+
+# -----------------------------------------------------------------------------
+# Ingest 接口
+# -----------------------------------------------------------------------------
+def _ingest_pipeline(task_id: str, text: str, payload: IngestRequest) -> int:
+    """
+    同步的 chunk → 去重 → embed/insert 全流程。
+    去重的 Redis 往返和 worker 的 embed/insert 都会阻塞等待，
+    必须经 asyncio.to_thread 调用，不能落在事件循环线程上。
+    """
+    chunker = _chunker(
+        payload.chunk.strategy,
+        payload.chunk.size,
+        payload.chunk.overlap,
+    )
+    chunks = chunker.chunk(text, meta=payload.metadata)
+
+    # 去重 key：xxh3 比 md5 快一个数量级，指纹用途不需要抗碰撞强度；
+    # hash 函数绑定到局部名，几百个 chunk 的循环里省掉逐次属性查找
+    _hexdigest = xxhash.xxh3_128_hexdigest
+    keys = [f"chunk:{_hexdigest(c.text.encode('utf-8'))}" for c in chunks]
+    # 检查 + 占位原子合并为一次调用（24h 窗口内不重复写入），
+    # 并发 ingest 同一文档时同一 chunk 只会有一个赢家
+    seen = query_cache.add_if_absent(keys, ttl=24 * 3600)
+    dedup_chunks = [c for c, dup in zip(chunks, seen, strict=True) if not dup]
+
+    return process_document_incremental(
+        doc_id=task_id,
+        chunks=dedup_chunks,
+        metadata=payload.metadata,
+    )
+
+
+# 不挂 response_model：IngestAck 由我们自己构造，已经过一次校验，
+# FastAPI 的二次 validate + jsonable_encoder 全程可以跳过
+@app.post("/ingest")
+async def ingest(
+    payload: IngestRequest,
+    request: Request,
+    api_ok: None = Depends(require_api_key),
+    dry_run: bool = Query(True, description="仅校验/预览，不入库/不入队"),
+):
+    # text/file_url 二选一和 overlap<size 都在模型校验阶段完成，
+    # 非法请求由 FastAPI 统一返回 422，进到这里的 payload 一定合法
+    task_id = _new_id()
+    kind: Literal["text", "file_url"] = "text" if payload.text else "file_url"
+
+    # 打日志方便追踪
+    trace_id = getattr(request.state, "trace_id", None)
+    correlation_id = getattr(request.state, "correlation_id", None)
+
+    logger.info(
+        "INGEST_ACCEPTED",
+        trace_id=trace_id,
+        correlation_id=correlation_id,
+        extra={
+            "task_id": task_id,
+            "kind": kind,
+            "chunk": {
+                "strategy": payload.chunk.strategy,
+                "size": payload.chunk.size,
+                "overlap": payload.chunk.overlap,
+            },
+            "source_id": payload.source_id,
+            "dry_run": dry_run,
+        },
+    )
+
+    ack = IngestAck(
+        task_id=task_id,
+        # 秒级前缀缓存的格式化器，输出与 datetime.isoformat 一致
+        accepted_at=_fast_iso_now(),
+        payload_kind=kind,
+        chunk_params=payload.chunk,
+        note="Accepted and validated. Queueing will be implemented on Day 6.",
+    )
+
+    # dry_run 模式：直接调用 chunker 预估分片数
+    if dry_run:
+        if payload.text:
+            try:
+                chunker = _chunker(
+                    payload.chunk.strategy,
+                    payload.chunk.size,
+                    payload.chunk.overlap,
+                )
+                # 预览只要数量：count 不切片、不建 Chunk 对象
+                # frozen 模型不可原地改，model_copy 生成带更新字段的新实例
+                ack = ack.model_copy(
+                    update={
+                        "preview_chunks": chunker.count(payload.text),
+                        "note": "Dry run only. No Milvus insert.",
+                    }
+                )
+            except Exception as e:
+                logger.exception(
+                    "INGEST_DRY_RUN_CHUNK_FAILED",
+                    trace_id=trace_id,
+                    correlation_id=correlation_id,
+                    extra={"error": str(e)},
+                )
+
+        return ORJSONResponse(ack.model_dump(mode="json"))
+    # ---------------------------------------------------------------------
+    # dry_run == False → 真正的 ingest 流程
+    # ---------------------------------------------------------------------
+    # 1) 获取文本（支持 file_url）
+    if payload.text:
+        text = payload.text
+    else:
+        try:
+            # 流式下载：64KB 一段增量解码，不一次性 buffer 整个响应体；
+            # 带硬上限，恶意/超大 URL 不会把网关内存打爆
+            parts: list[str] = []
+            total = 0
+            async with request.app.state.http.stream("GET", str(payload.file_url)) as r:
+                r.raise_for_status()
+                async for part in r.aiter_text(65536):
+                    total += len(part)
+                    if total > INGEST_MAX_FILE_CHARS:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=(
+                                "file_url content exceeds "
+                                f"{INGEST_MAX_FILE_CHARS} chars"
+                            ),
+                        )
+                    parts.append(part)
+            text = "".join(parts)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=502, detail=f"Failed to download file_url: {e}"
+            ) from e
+
+    # 2) 调用 Worker 执行 chunk → 去重 → embed → milvus insert。
+    # 整条流水线是同步阻塞的（Redis 去重 + 等 worker 的 embed/insert），
+    # 丢进线程池跑，事件循环只 await 结果，不被单个 ingest 卡住
+    try:
+        inserted = await asyncio.to_thread(_ingest_pipeline, task_id, text, payload)
+    except Exception as e:
+        logger.exception(
+            "INGEST_PROCESSING_FAILED",
+            trace_id=trace_id,
+            correlation_id=correlation_id,
+            extra={
+                "task_id": task_id,
+                "error": str(e),
+            },
+        )
+        raise HTTPException(status_code=500, detail=f"Ingest failed: {e}") from e
+
+    ack = ack.model_copy(
+        update={
+            "preview_chunks": inserted,
+            "note": f"Inserted {inserted} chunks into Milvus.",
+        }
+    )
+    return ORJSONResponse(ack.model_dump(mode="json"))
+
+
+# -----------------------------------------------------------------------------
+# Query 接口：向量检索（统一 DummyEmbeddingModel）
+# -----------------------------------------------------------------------------
+@app.get("/query")
+async def query_endpoint(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    api_ok: None = Depends(require_api_key),
+    q: str = Query(..., description="查询文本"),
+    top_k: int = Query(5, ge=1, le=20),
+    hybrid: bool = Query(False, description="是否使用 hybrid 检索"),
+    vector_k: int = 5,
+    bm25_k: int = 5,
+    rerank: bool = Query(False, description="是否启用 rerank（仅 hybrid 模式）"),
+    page: int = Query(1, ge=1, le=1_000_000),
+    page_size: int = Query(10, ge=1, le=50),
+    debug: bool = Query(False, description="是否返回调试信息（仅 hybrid 模式生效）"),
+):
+    """
+    支持 hybrid 检索：
+    - hybrid=false: 仅向量检索（Milvus）
+    - hybrid=true: vector + BM25 (+ RRF + 可选 Rerank)
+    Day23: 增加 Milvus/Redis 故障降级能力：
+      - Milvus 故障 -> 自动降级为 BM25-only
+      - Redis 缓存不可用 -> 自动回退内存缓存，标记 redis_ok=False
+    """
+
+    trace_id = getattr(request.state, "trace_id", None) or _new_id()
+    correlation_id = getattr(request.state, "correlation_id", None)
+    # 单调时钟 + 整数 ns：不受系统时钟回拨影响，分支内各打一次点即可
+    t_start = time.perf_counter_ns()
+
+    # -----------------------------------------------------
+    # 降级/健康状态标记
+    # -----------------------------------------------------
+    milvus_ok = True
+    degraded = False
+    degraded_mode: str | None = None
+    degraded_reason: str | None = None
+
+    # Redis 状态
+    try:
+        redis_ok = query_cache.is_redis_available()
+    except Exception:
+        redis_ok = True  # 没这个方法就当作 True
+
+    # -----------------------------------------------------
+    # 缓存处理
+    #   - debug=True 时：完全绕过缓存（不读不写）
+    #   - 降级结果不写入缓存（避免缓存住故障状态）
+    # -----------------------------------------------------
+    cache_key: str | None = None
+    cached: dict[str, Any] | None = None
+
+    if not debug and redis_ok:
+        cache_key = query_cache.make_key(
+            q,
+            hybrid,
+            top_k,
+            vector_k,
+            bm25_k,
+            page,
+            page_size,
+            rerank,
+        )
+        # Redis 同步客户端的 socket 往返也不能占事件循环
+        cached = await asyncio.to_thread(query_cache.get, cache_key)
+
+    if cached:
+        # 给缓存结果补充 trace_id / cache_hit / 健康信息
+        cached["trace_id"] = trace_id
+        cached["cache_hit"] = True
+        cached.setdefault("degraded", False)
+        cached.setdefault("degraded_mode", None)
+        cached.setdefault("degraded_reason", None)
+        cached.setdefault("milvus_ok", True)
+        cached.setdefault("redis_ok", redis_ok)
+
+        # 响应发出后再写日志，序列化/落盘不占用户可见延迟
+        background_tasks.add_task(
+            query_logger.log,
+            {
+                "trace_id": trace_id,
+                "query": q,
+                "hybrid": hybrid,
+                "top_k": top_k,
+                "latency_ms": 0,
+                "result_count": len(cached.get("results", [])),
+                "cache_hit": True,
+                "degraded": cached.get("degraded", False),
+                "milvus_ok": cached.get("milvus_ok"),
+                "redis_ok": cached.get("redis_ok"),
+                "degraded_reason": cached.get("degraded_reason"),
+                "timestamp": _fast_iso_now(),
+            },
+        )
+
+        logger.info(
+            "QUERY_CACHE_HIT",
+            trace_id=trace_id,
+            correlation_id=correlation_id,
+            extra={
+                "query": q,
+                "hybrid": hybrid,
+                "top_k": top_k,
+                "result_count": len(cached.get("results", [])),
+            },
+        )
+
+        # 直接包成 ORJSONResponse，跳过 FastAPI 的 jsonable_encoder 再遍历
+        return ORJSONResponse(cached)
+
+    # -----------------------------------------------------
+    # 缓存 miss → 执行真实检索
+    # -----------------------------------------------------
+    if not hybrid:
+        # =================================================
+        # 分支一：纯向量检索（带 Milvus 降级）
+        # =================================================
+        try:
+            t0 = time.perf_counter_ns()
+            # 检索是阻塞调用（Milvus gRPC），丢进线程池执行，
+            # 事件循环在等待期间可以继续服务其他请求
+            res = await asyncio.to_thread(vector_retriever.search, q, top_k)
+            t1 = time.perf_counter_ns()
+
+            raw_hits = res.get("results", [])
+            # 单个推导式在更紧的 C 帧里跑完格式化；
+            # meta 用 walrus 只取一次，text 命中时整段短路跳过
+            formatted: list[dict[str, Any]] = [
+                {
+                    "doc_id": hit.get("doc_id"),
+                    "chunk_id": hit.get("chunk_id"),
+                    "text": hit.get("text")
+                    or (meta := hit.get("meta") or _EMPTY_META).get("text")
+                    or meta.get("content"),
+                    "score_vector": float(hit["score"]) if "score" in hit else None,
+                    "score_bm25": None,
+                    "rrf_score": None,
+                    "sources": _VEC_SOURCES,
+                    **({"error": hit["error"]} if "error" in hit else {}),
+                }
+                for hit in raw_hits
+            ]
+
+            latency_ms = {
+                "vector": round((t1 - t0) / 1e6, 2),
+                "total": round((t1 - t_start) / 1e6, 2),
+            }
+
+            response: dict[str, Any] = {
+                "trace_id": trace_id,
+                "cache_hit": False,
+                "query": q,
+                "hybrid": False,
+                "top_k": top_k,
+                "latency_ms": latency_ms,
+                "results": formatted,
+            }
+
+        except Exception as e:
+            # -----------------------------
+            # Milvus 故障 → 降级为 BM25-only
+            # -----------------------------
+            milvus_ok = False
+            degraded = True
+            degraded_mode = "bm25_only"
+            degraded_reason = f"vector_search_failed: {e}"
+
+            t_bm0 = time.perf_counter_ns()
+            bm25_hits = await asyncio.to_thread(bm25_retriever.search, q, top_k)
+            t_bm1 = time.perf_counter_ns()
+
+            formatted = _format_bm25_fallback(bm25_hits)
+
+            latency_ms = {
+                "vector": 0.0,
+                "bm25": round((t_bm1 - t_bm0) / 1e6, 2),
+                "total": round((t_bm1 - t_start) / 1e6, 2),
+            }
+
+            response = {
+                "trace_id": trace_id,
+                "cache_hit": False,
+                "query": q,
+                "hybrid": False,
+                "top_k": top_k,
+                "latency_ms": latency_ms,
+                "results": formatted,
+            }
+
+    else:
+        # =================================================
+        # 分支二：Hybrid 检索（向量 + BM25 + RRF）
+        # 若内部出现 Milvus 错误，同样降级为 BM25-only
+        # =================================================
+        try:
+            # 同样放到线程池：hybrid 内部是 Milvus RPC + BM25 CPU 计算
+            res = await asyncio.to_thread(
+                hybrid_retriever.search,
+                query=q,
+                vector_k=vector_k,
+                bm25_k=bm25_k,
+                top_k=top_k,
+                rerank=rerank,
+                page=page,
+                page_size=page_size,
+                debug=debug,
+            )
+
+            response = {
+                "trace_id": trace_id,
+                "cache_hit": False,
+                "query": q,
+                "hybrid": True,
+                "top_k": top_k,
+                "vector_k": vector_k,
+                "bm25_k": bm25_k,
+                "rerank": rerank,
+                "latency_ms": res.get("latency_ms", {}),
+                "pagination": res.get("pagination"),
+                "results": res.get("final_results") or res.get("fused_results", []),
+            }
+
+            if debug:
+                response["debug"] = res.get("debug")
+
+        except Exception as e:
+            # -----------------------------
+            # Hybrid 内部异常（通常是 Milvus）→ BM25-only
+            # -----------------------------
+            milvus_ok = False
+            degraded = True
+            degraded_mode = "bm25_only"
+            degraded_reason = f"hybrid_search_failed: {e}"
+
+            t_bm0 = time.perf_counter_ns()
+            bm25_hits = await asyncio.to_thread(bm25_retriever.search, q, top_k)
+            t_bm1 = time.perf_counter_ns()
+
+            formatted = _format_bm25_fallback(bm25_hits)
+
+            latency_ms = {
+                "bm25": round((t_bm1 - t_bm0) / 1e6, 2),
+                "total": round((t_bm1 - t_start) / 1e6, 2),
+            }
+
+            response = {
+                "trace_id": trace_id,
+                "cache_hit": False,
+                "query": q,
+                "hybrid": True,
+                "top_k": top_k,
+                "vector_k": vector_k,
+                "bm25_k": top_k,
+                "rerank": False,
+                "latency_ms": latency_ms,
+                "pagination": {
+                    "page": 1,
+                    "page_size": len(formatted) or page_size,
+                    "total": len(formatted),
+                },
+                "results": formatted,
+            }
+
+    # -----------------------------------------------------
+    # 补充降级 & 健康元信息
+    # -----------------------------------------------------
+    response["degraded"] = degraded
+    response["degraded_mode"] = degraded_mode
+    response["degraded_reason"] = degraded_reason
+    response["milvus_ok"] = milvus_ok
+    response["redis_ok"] = redis_ok
+
+    # -----------------------------------------------------
+    # 写入缓存（debug=True / degraded=True 不写；空结果也不写）
+    # -----------------------------------------------------
+    if (
+        not debug
+        and cache_key
+        and response.get("results")
+        and not response.get("degraded", False)
+    ):
+        # Day 12 约定：短期缓存 30s；同样走线程池，写缓存不阻塞响应
+        await asyncio.to_thread(query_cache.set, cache_key, response, ttl=30)
+
+    # -----------------------------------------------------
+    # 写入日志（文件 + SQLite）——响应发出后台执行
+    # -----------------------------------------------------
+    background_tasks.add_task(
+        query_logger.log,
+        {
+            "trace_id": trace_id,
+            "query": q,
+            "hybrid": hybrid,
+            "top_k": top_k,
+            "latency_ms": response.get("latency_ms", {}).get("total", None),
+            "result_count": len(response.get("results", [])),
+            "cache_hit": False,
+            "degraded": degraded,
+            "degraded_mode": degraded_mode,
+            "degraded_reason": degraded_reason,
+            "milvus_ok": milvus_ok,
+            "redis_ok": redis_ok,
+            "payload": response,
+        },
+    )
+
+    logger.info(
+        "QUERY_EXECUTED",
+        trace_id=trace_id,
+        correlation_id=correlation_id,
+        extra={
+            "query": q,
+            "hybrid": hybrid,
+            "top_k": top_k,
+            "latency_ms": response.get("latency_ms", {}),
+            "result_count": len(response.get("results", [])),
+            "degraded": degraded,
+            "degraded_mode": degraded_mode,
+            "milvus_ok": milvus_ok,
+            "redis_ok": redis_ok,
+        },
+    )
+
+    # 响应 dict 全部由我们自己构造（JSON 原生类型），直接 orjson 序列化
+    return ORJSONResponse(response)
+
+
+# -----------------------------------------------------------------------------
+# Batch Query 接口：N 条查询合并为一次 embed_batch + 一次 Milvus 多向量检索
+# -----------------------------------------------------------------------------
+class QueryBatchRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+    queries: list[str] = Field(..., min_length=1, max_length=64)
+    top_k: int = Field(5, ge=1, le=20)
+
+
+def _search_batch(queries: list[str], top_k: int) -> list[list[dict[str, Any]]]:
+    """批量 embedding + 单次 Milvus RPC，在线程池里同步执行"""
+    vectors = get_embedding_model().embed_batch(queries)
+    mat = np.asarray(vectors, dtype=np.float32)
+    return _milvus_factory.search_vectors_batch(mat, top_k=top_k)
+
+
+@app.post("/query/batch")
+async def query_batch(
+    request: Request,
+    payload: QueryBatchRequest,
+    api_ok: None = Depends(require_api_key),
+):
+    """
+    一次请求带 N 条查询（评测回放、批量补全等场景）。
+    相比循环调 /query：embedding 走一次 embed_batch，
+    Milvus 走一次多向量 search（单 RPC、服务端并行），
+    省掉 N-1 次 gRPC 往返和逐条 embedding 的调度开销。
+    仅支持纯向量检索；需要 hybrid/rerank 的请走 /query。
+    """
+    trace_id = getattr(request.state, "trace_id", None) or _new_id()
+    t0 = time.perf_counter_ns()
+
+    try:
+        all_hits = await asyncio.to_thread(
+            _search_batch, payload.queries, payload.top_k
+        )
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"batch_search_failed: {e}") from e
+
+    t1 = time.perf_counter_ns()
+
+    results = [
+        {
+            "query": q,
+            "results": [
+                {
+                    "doc_id": hit.get("doc_id"),
+                    "chunk_id": hit.get("chunk_id"),
+                    "text": hit.get("text")
+                    or (meta := hit.get("meta") or _EMPTY_META).get("text")
+                    or meta.get("content"),
+                    "score_vector": float(hit["score"]) if "score" in hit else None,
+                    "sources": _VEC_SOURCES,
+                    **({"error": hit["error"]} if "error" in hit else {}),
+                }
+                for hit in hits
+            ],
+        }
+        for q, hits in zip(payload.queries, all_hits, strict=True)
+    ]
+
+    return ORJSONResponse(
+        {
+            "trace_id": trace_id,
+            "count": len(results),
+            "top_k": payload.top_k,
+            "latency_ms": {"total": round((t1 - t0) / 1e6, 2)},
+            "results": results,
+        }
+    )
@@ -1,17 +1,250 @@
 # services/embedding_worker/worker.py
+import atexit
 import os
+import queue
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from typing import Any
 
+import numpy as np
+
 from libs.chunking.text_chunker import TextChunker
 from libs.db.milvus_client import MilvusClientFactory
 from libs.embedding.factory import get_embedding_model
+from libs.logging.structured_logger import _fast_iso_now
 
 # 单次批量插入的最大 chunk 数量，可通过环境变量覆盖
 DEFAULT_BATCH_SIZE = 2000
 BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", DEFAULT_BATCH_SIZE))
 
+# embedding micro-batch：并发 ingest 各自的小批文本凑成一次 embed_batch，
+# 攒到 EMBED_MICROBATCH 条或等满 EMBED_FLUSH_MS 毫秒就触发
+EMBED_MICROBATCH = int(os.getenv("EMBED_MICROBATCH", "64"))
+EMBED_FLUSH_MS = float(os.getenv("EMBED_FLUSH_MS", "20"))
+
+_embed_queue: queue.Queue = queue.Queue()
+
+
+def _embed_loop() -> None:
+    """后台合批线程：收集 (texts, future)，一次 embed_batch 后按片回填结果"""
+    while True:
+        first_texts, first_fut = _embed_queue.get()
+        pending = [(first_texts, first_fut)]
+        total = len(first_texts)
+        deadline = time.monotonic() + EMBED_FLUSH_MS / 1000.0
+
+        while total < EMBED_MICROBATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                texts, fut = _embed_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append((texts, fut))
+            total += len(texts)
+
+        all_texts = [t for texts, _ in pending for t in texts]
+        try:
+            vectors = get_embedding_model().embed_batch(all_texts)
+        except Exception as e:
+            for _, fut in pending:
+                fut.set_exception(e)
+            continue
+
+        offset = 0
+        for texts, fut in pending:
+            fut.set_result(vectors[offset : offset + len(texts)])
+            offset += len(texts)
+
+
+_embed_thread = threading.Thread(
+    target=_embed_loop, name="embed-microbatch", daemon=True
+)
+_embed_thread.start()
+
+
+def _embed_texts(texts: list[str]):
+    """提交到合批队列并阻塞等待本批的 embedding 切片"""
+    fut: Future = Future()
+    _embed_queue.put((texts, fut))
+    return fut.result()
+
+
+# insert 合批：大量小文档各自 insert 时，每个 RPC 只带几行，
+# gRPC 往返成本摊不薄；跨文档把列数据拼成一个批次后一次 insert。
+# doc_id 列本来就逐行携带，合并后行归属不丢
+INSERT_MICROBATCH = int(os.getenv("INSERT_MICROBATCH", "256"))
+INSERT_FLUSH_MS = float(os.getenv("INSERT_FLUSH_MS", "20"))
+
+# 超大批拆成 shard 级子批并行发：collection 建为多 shard
+# （MILVUS_SHARDS_NUM）后，子批按 shard 哈希落到不同 DataNode 并行消费
+INSERT_SUBBATCH = int(os.getenv("INSERT_SUBBATCH", "10000"))
+_INSERT_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("INSERT_WORKERS", "4")),
+    thread_name_prefix="insert-sub",
+)
+
+_insert_queue: queue.Queue = queue.Queue()
+
+
+def _do_insert(col, data) -> None:
+    """小批直接插；超过 INSERT_SUBBATCH 的批拆子批并行插"""
+    n = len(data[1])
+    if n <= INSERT_SUBBATCH:
+        col.insert(data)
+        return
+    futures = [
+        _INSERT_POOL.submit(
+            col.insert,
+            [column[start : start + INSERT_SUBBATCH] for column in data],
+        )
+        for start in range(0, n, INSERT_SUBBATCH)
+    ]
+    for fut in futures:
+        fut.result()
+
+
+def _insert_buffer_loop() -> None:
+    """后台合批线程：收集 (collection, data, future)，按 collection 合并插入"""
+    while True:
+        first_col, first_data, first_fut = _insert_queue.get()
+        pending = [(first_col, first_data, first_fut)]
+        total = len(first_data[1])
+        deadline = time.monotonic() + INSERT_FLUSH_MS / 1000.0
+
+        while total < INSERT_MICROBATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                col, data, fut = _insert_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append((col, data, fut))
+            total += len(data[1])
+
+        # 按 collection 对象分组（正常部署只有 rag_collection 一组）
+        groups: dict[int, list] = {}
+        for col, data, fut in pending:
+            groups.setdefault(id(col), []).append((col, data, fut))
+
+        for items in groups.values():
+            col = items[0][0]
+            if len(items) == 1:
+                merged = items[0][1]
+            else:
+                merged = [
+                    np.vstack([np.asarray(data[0]) for _, data, _ in items]),
+                    [x for _, data, _ in items for x in data[1]],
+                    [x for _, data, _ in items for x in data[2]],
+                    [x for _, data, _ in items for x in data[3]],
+                ]
+            try:
+                _do_insert(col, merged)
+            except Exception as e:
+                for _, _, fut in items:
+                    fut.set_exception(e)
+                continue
+            # 按各自行数回报，与原先 primary_keys 缺失时的兜底口径一致
+            for _, data, fut in items:
+                fut.set_result(len(data[1]))
+
+
+_insert_thread = threading.Thread(
+    target=_insert_buffer_loop, name="insert-microbatch", daemon=True
+)
+_insert_thread.start()
+
+
+def _insert_rows(collection, data) -> int:
+    """提交到 insert 合批队列并阻塞等待本文档的行数确认"""
+    fut: Future = Future()
+    _insert_queue.put((collection, data, fut))
+    return fut.result()
+
+
+# flush 合并：增量 ingest 常是单 chunk 小插入，逐次 flush 会把 TPS
+# 压到 Milvus seal/持久化的节奏上；攒满行数或到时限才真正 flush 一次
+FLUSH_MAX_ROWS = int(os.getenv("FLUSH_MAX_ROWS", "100000"))
+FLUSH_MAX_WAIT_MS = float(os.getenv("FLUSH_MAX_WAIT_MS", "200"))
+
+
+class _FlushCoalescer:
+    """
+    把高频小插入后的 collection.flush() 去抖合并：
+    行数攒够 FLUSH_MAX_ROWS 立即 flush，否则由 Timer 在
+    FLUSH_MAX_WAIT_MS 后兜底。代价是新数据可查询性最多延迟一个时窗。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending_rows = 0
+        self._collection = None
+        self._timer: threading.Timer | None = None
+
+    def notify(self, collection, rows: int) -> None:
+        with self._lock:
+            self._collection = collection
+            self._pending_rows += rows
+            if self._pending_rows >= FLUSH_MAX_ROWS:
+                self._flush_locked()
+            elif self._timer is None:
+                timer = threading.Timer(FLUSH_MAX_WAIT_MS / 1000.0, self._on_timer)
+                timer.daemon = True
+                self._timer = timer
+                timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        collection, rows = self._collection, self._pending_rows
+        self._collection = None
+        self._pending_rows = 0
+        if collection is None or rows == 0:
+            return
+        try:
+            t0 = time.perf_counter()
+            collection.flush()
+            flush_ms = (time.perf_counter() - t0) * 1000.0
+            print(
+                f"[FLUSH] {_fast_iso_now()} "
+                f"coalesced_rows={rows} flush_ms={flush_ms:.2f}"
+            )
+        except Exception as e:
+            # flush 失败不影响已 insert 的数据，留给下一轮/Milvus 自动 seal
+            print(f"⚠️ coalesced flush failed: {e}")
+
+    def close(self) -> None:
+        """优雅退出：把尚未落盘的插入冲掉"""
+        with self._lock:
+            self._flush_locked()
+
+
+_flusher = _FlushCoalescer()
+atexit.register(_flusher.close)
+
+
+@lru_cache(maxsize=8)
+def _get_collection(name: str, dim: int):
+    """
+    collection 句柄 + load() 每进程每 (name, dim) 只做一次：
+    describe/load 都是 RPC，此前每个文档都要重付一轮。
+    Milvus 不可用时异常原样抛出（lru_cache 不缓存异常，下次重试）。
+    """
+    factory = MilvusClientFactory()
+    collection = factory.get_or_create_collection(name=name, dim=dim)
+    # 搜索阶段会再 load + 建索引，这里只确保 collection 可用
+    collection.load()
+    return factory, collection
+
 
 def process_document(
     doc_id: str,
@@ -39,13 +272,11 @@ def process_document(
     chunks = chunker.chunk(text)
     num_chunks = len(chunks)
     if num_chunks == 0:
-        print(
-            f"[INGEST] {datetime.utcnow().isoformat()} doc_id={doc_id} no chunks, skip."
-        )
+        print(f"[INGEST] {_fast_iso_now()} doc_id={doc_id} no chunks, skip.")
         return 0
 
     print(
-        f"[INGEST] {datetime.utcnow().isoformat()} "
+        f"[INGEST] {_fast_iso_now()} "
         f"doc_id={doc_id} total_chunks={num_chunks} "
         f"strategy={chunk_params.strategy} size={chunk_params.size} "
         f"overlap={chunk_params.overlap}"
@@ -61,25 +292,63 @@ def process_document(
     if model_dim is None:
         model_dim = int(os.getenv("EMBEDDING_DIM", 768))
 
-    factory = MilvusClientFactory()
-    collection = factory.get_or_create_collection(
-        name="rag_collection",
-        dim=model_dim,
-    )
-    # 搜索阶段会再 load + 建索引，这里只确保 collection 存在即可
-    collection.load()
+    factory, collection = _get_collection("rag_collection", model_dim)
 
     # 用一个固定的 received_at，保证同一批次一致
-    received_at = datetime.utcnow().isoformat()
-    total_inserted = 0
+    received_at = _fast_iso_now()
+
+    # meta 里除 text 外的字段全批次相同：共用一个原型 dict，
+    # 每个 chunk 只做一次 {**proto, "text": t} 展开，不重复分配键和值引用
+    meta_proto = {
+        "source": "api_ingest",
+        "received_at": received_at,
+        "user_meta": metadata or {},
+    }
 
     # 计算批次数方便日志
     batch_size = max(1, BATCH_SIZE)
     total_batches = (num_chunks + batch_size - 1) // batch_size
 
     # -----------------------------
-    # 3) 分批 embedding + insert
+    # 3) 两段流水线：主线程 embedding，插入线程 Milvus RPC
+    #    embedding 是 CPU 计算、insert 是网络 I/O，顺序执行时互相空等；
+    #    用有界队列（maxsize=2）把两段叠起来，队列满即背压，
+    #    长文档吞吐接近 max(embed_ms, insert_ms) 而非两者之和
     # -----------------------------
+    insert_queue: queue.Queue = queue.Queue(maxsize=2)
+    inserted_so_far = [0]
+    insert_errors: list[Exception] = []
+
+    def _insert_loop() -> None:
+        while True:
+            item = insert_queue.get()
+            if item is None:
+                break
+            batch_idx, batch_count, embed_ms, data = item
+            if insert_errors:
+                # 已失败：只清空队列防止生产者在 put 上卡死
+                continue
+            try:
+                t_insert_start = time.perf_counter()
+                batch_inserted = _insert_rows(collection, data)
+                insert_ms = (time.perf_counter() - t_insert_start) * 1000.0
+            except Exception as e:
+                insert_errors.append(e)
+                continue
+
+            inserted_so_far[0] += batch_inserted
+
+            print(
+                f"[INGEST] {_fast_iso_now()} "
+                f"doc_id={doc_id} batch={batch_idx}/{total_batches} "
+                f"batch_size={batch_count} embed_ms={embed_ms:.2f} "
+                f"insert_ms={insert_ms:.2f} "
+                f"cumulative_inserted={inserted_so_far[0]}"
+            )
+
+    inserter = threading.Thread(target=_insert_loop, name="ingest-insert", daemon=True)
+    inserter.start()
+
     for batch_idx, start in enumerate(range(0, num_chunks, batch_size), start=1):
         end = min(start + batch_size, num_chunks)
         batch_chunks = chunks[start:end]
@@ -89,58 +358,45 @@ def process_document(
         batch_count = len(batch_texts)
 
         # ---- 3.2 批量 embedding ----
-        t_embed_start = time.time()
-        batch_vectors = model.embed_batch(batch_texts)
-        t_embed_end = time.time()
+        t_embed_start = time.perf_counter()
+        batch_vectors = _embed_texts(batch_texts)
+        # 压成连续 ndarray（dtype 与 collection 向量字段一致）：
+        # pymilvus 对连续矩阵按行 memcpy 打包，
+        # 不再逐元素遍历 list-of-list 的 Python 对象
+        batch_vectors = np.ascontiguousarray(
+            batch_vectors, dtype=factory.vector_np_dtype()
+        )
+        embed_ms = (time.perf_counter() - t_embed_start) * 1000.0
 
         # ---- 3.3 构建 doc_id / chunk_id / meta ----
         batch_doc_ids = [doc_id] * batch_count
         # chunk_id 使用全局连续编号，方便 debug
         batch_chunk_ids = list(range(start, end))
-        batch_metas = [
-            {
-                "source": "api_ingest",
-                "received_at": received_at,
-                "text": batch_texts[i],
-                "user_meta": metadata or {},
-            }
-            for i in range(batch_count)
-        ]
+        batch_metas = [{**meta_proto, "text": t} for t in batch_texts]
 
         data = [batch_vectors, batch_doc_ids, batch_chunk_ids, batch_metas]
 
-        # ---- 3.4 插入 Milvus ----
-        t_insert_start = time.time()
-        result = collection.insert(data)
-        t_insert_end = time.time()
+        # ---- 3.4 交给插入线程（队列满时在此阻塞，形成背压）----
+        insert_queue.put((batch_idx, batch_count, embed_ms, data))
+        if insert_errors:
+            break
 
-        # 有些版本的 result 可能不带 primary_keys，兜底以 batch_count 计数
-        batch_inserted = (
-            len(getattr(result, "primary_keys", []))
-            if result is not None and hasattr(result, "primary_keys")
-            else batch_count
-        )
-        total_inserted += batch_inserted
+    insert_queue.put(None)
+    inserter.join()
 
-        embed_ms = (t_embed_end - t_embed_start) * 1000.0
-        insert_ms = (t_insert_end - t_insert_start) * 1000.0
+    if insert_errors:
+        raise insert_errors[0]
 
-        print(
-            f"[INGEST] {datetime.utcnow().isoformat()} "
-            f"doc_id={doc_id} batch={batch_idx}/{total_batches} "
-            f"batch_size={batch_count} embed_ms={embed_ms:.2f} "
-            f"insert_ms={insert_ms:.2f} "
-            f"cumulative_inserted={total_inserted}"
-        )
+    total_inserted = inserted_so_far[0]
 
     # -----------------------------
     # 4) Flush 一次，确保持久化
     # -----------------------------
-    flush_start = time.time()
+    flush_start = time.perf_counter()
     collection.flush()
-    flush_end = time.time()
+    flush_end = time.perf_counter()
     print(
-        f"[INGEST] {datetime.utcnow().isoformat()} "
+        f"[INGEST] {_fast_iso_now()} "
         f"doc_id={doc_id} flush_ms={(flush_end - flush_start) * 1000.0:.2f} "
         f"total_inserted={total_inserted}"
     )
@@ -162,10 +418,7 @@ def process_document_incremental(
     """
     num_chunks = len(chunks)
     if num_chunks == 0:
-        print(
-            f"[INGEST-INCR] {datetime.utcnow().isoformat()} "
-            f"doc_id={doc_id} no new chunks, skip."
-        )
+        print(f"[INGEST-INCR] {_fast_iso_now()} doc_id={doc_id} no new chunks, skip.")
         return 0
 
     # -----------------------------
@@ -177,57 +430,46 @@ def process_document_incremental(
     if model_dim is None:
         model_dim = int(os.getenv("EMBEDDING_DIM", 768))
 
-    factory = MilvusClientFactory()
-    collection = factory.get_or_create_collection(
-        name="rag_collection",
-        dim=model_dim,
-    )
-    collection.load()
+    factory, collection = _get_collection("rag_collection", model_dim)
 
-    received_at = datetime.utcnow().isoformat()
+    received_at = _fast_iso_now()
 
     # -----------------------------
     # 构建 embedding 输入
     # -----------------------------
     batch_texts = [c.text for c in chunks]
-    batch_vectors = model.embed_batch(batch_texts)
+    batch_vectors = _embed_texts(batch_texts)
+    # 同 process_document：连续 ndarray，插入时整块 memcpy
+    batch_vectors = np.ascontiguousarray(batch_vectors, dtype=factory.vector_np_dtype())
 
     batch_doc_ids = [doc_id] * num_chunks
     # 使用 chunk 自带 chunk_id，避免编号错乱
     batch_chunk_ids = [c.chunk_id for c in chunks]
-    batch_metas = [
-        {
-            "source": "api_ingest_incremental",
-            "received_at": received_at,
-            "text": c.text,
-            "user_meta": metadata or {},
-        }
-        for c in chunks
-    ]
+    # 同 process_document：固定字段放进原型 dict，逐 chunk 只展开 text
+    meta_proto = {
+        "source": "api_ingest_incremental",
+        "received_at": received_at,
+        "user_meta": metadata or {},
+    }
+    batch_metas = [{**meta_proto, "text": t} for t in batch_texts]
 
     data = [batch_vectors, batch_doc_ids, batch_chunk_ids, batch_metas]
 
     # -----------------------------
-    # 插入 Milvus
+    # 插入 Milvus（经合批缓冲：并发小 ingest 会拼成一次 RPC）
     # -----------------------------
-    t_insert_start = time.time()
-    result = collection.insert(data)
-    t_insert_end = time.time()
-
-    batch_inserted = (
-        len(getattr(result, "primary_keys", []))
-        if result is not None and hasattr(result, "primary_keys")
-        else num_chunks
-    )
+    t_insert_start = time.perf_counter()
+    batch_inserted = _insert_rows(collection, data)
+    t_insert_end = time.perf_counter()
 
     print(
-        f"[INGEST-INCR] {datetime.utcnow().isoformat()} "
+        f"[INGEST-INCR] {_fast_iso_now()} "
         f"doc_id={doc_id} new_chunks={num_chunks} "
         f"insert_ms={(t_insert_end - t_insert_start) * 1000.0:.2f} "
         f"inserted={batch_inserted}"
     )
 
-    # Flush（小批次也 flush，保证可查询）
-    collection.flush()
+    # Flush 交给合并器：攒批/到时限再落盘，小插入不再逐次 flush
+    _flusher.notify(collection, batch_inserted)
 
     return batch_inserted
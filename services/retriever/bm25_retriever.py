@@ -1,39 +1,196 @@
 # services/retriever/bm25_retriever.py
 
+import os
+import threading
+from itertools import chain
 from typing import Any
 
+import numpy as np
 from opentelemetry import trace
-from rank_bm25 import BM25Okapi
 
 from libs.db.milvus_client import MilvusClientFactory
 
 _tracer = trace.get_tracer("bm25-retriever")
 
+# BM25 索引磁盘缓存目录；按 collection 行数做签名，行数变了自动重建
+BM25_CACHE_DIR = os.getenv("BM25_CACHE_DIR", "bm25_cache")
+
+
+def _pack_strings(items: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """字符串列表 → (utf-8 字节块, 偏移数组)，可直接进 npz"""
+    encoded = [s.encode("utf-8") for s in items]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+
+def _unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> list[str]:
+    raw = blob.tobytes()
+    return [
+        raw[s:e].decode("utf-8")
+        for s, e in zip(offsets[:-1].tolist(), offsets[1:].tolist(), strict=True)
+    ]
+
 
 class BM25Retriever:
     """
-    使用 rank_bm25 实现本地 BM25 召回。
+    本地 BM25 召回（Okapi 打分，与 rank_bm25 的默认参数/兜底逻辑一致）。
     目前的 corpus 来源：Milvus 中所有 chunks 的原文片段（meta["text"]）。
     （可在 Day 11/12 迁移到 Redis/ES）
+
+    索引是 numpy 倒排表（term-major CSR：indptr/doc/tf 三个扁平数组）：
+    打分对每个查询词只做一次 fancy-index 累加，O(df) 的 C 级向量运算，
+    替代 rank_bm25 逐文档的纯 Python get_scores 循环。
     """
 
+    # 与 rank_bm25.BM25Okapi 的默认超参保持一致
+    K1 = 1.5
+    B = 0.75
+    EPSILON = 0.25
+
     def __init__(self):
         self.milvus = MilvusClientFactory()
         self._initialized = False
+        # hybrid 双路并行后 search 可能被多线程同时首调，懒加载需要上锁
+        self._load_lock = threading.Lock()
         self.corpus: list[str] = []
-        self.bm25: BM25Okapi | None = None
+        # corpus 的 object ndarray 视图：top-k 文本一次 fancy-index 取齐
+        self._corpus_np: np.ndarray | None = None
+        # 倒排索引：term id -> postings 区间 [indptr[t], indptr[t+1])
+        self._vocab: dict[str, int] = {}
+        self._post_indptr: np.ndarray | None = None
+        self._post_docs: np.ndarray | None = None
+        self._post_tfs: np.ndarray | None = None
+        self._idf: np.ndarray | None = None
+        # 每文档的长度归一项 k1*(1 - b + b*dl/avgdl)，打分时直接 gather
+        self._len_norm: np.ndarray | None = None
+
+    def _build_index(self, tokenized: list[list[str]]) -> None:
+        n_docs = len(tokenized)
+        doc_lens = np.fromiter(map(len, tokenized), dtype=np.int64, count=n_docs)
+        # 空 corpus 时 mean() 是 nan（且 nan or 1.0 还是 nan），显式兜底
+        avgdl = (float(doc_lens.mean()) if n_docs else 0.0) or 1.0
+        self._len_norm = (self.K1 * (1.0 - self.B + self.B * doc_lens / avgdl)).astype(
+            np.float32
+        )
+
+        # 向量化聚合：token 流展平后，词表/词频/postings 全在 np.unique
+        # 的 C 级排序里完成，替代逐文档 Counter + dict 的 Python 循环。
+        # (term_id, doc_id) 编码进一个 int64，unique 的 counts 即 tf，
+        # 结果按 term 有序 → 直接就是 CSR postings 的扁平布局
+        flat = list(chain.from_iterable(tokenized))
+        if not flat:
+            self._vocab = {}
+            self._post_indptr = np.zeros(1, dtype=np.int64)
+            self._post_docs = np.zeros(0, dtype=np.int64)
+            self._post_tfs = np.zeros(0, dtype=np.float32)
+            self._idf = np.zeros(0, dtype=np.float32)
+            return
+
+        tokens = np.asarray(flat)
+        doc_idx = np.repeat(np.arange(n_docs, dtype=np.int64), doc_lens)
+        uniq_terms, term_ids = np.unique(tokens, return_inverse=True)
+        pairs = term_ids.astype(np.int64) * n_docs + doc_idx
+        uniq_pairs, tfs = np.unique(pairs, return_counts=True)
+
+        self._post_docs = uniq_pairs % n_docs
+        self._post_tfs = tfs.astype(np.float32)
+        df = np.bincount(uniq_pairs // n_docs, minlength=len(uniq_terms))
+        indptr = np.zeros(len(uniq_terms) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+        self._post_indptr = indptr
+        self._vocab = {t: i for i, t in enumerate(uniq_terms.tolist())}
+
+        # Okapi idf；负 idf 与 rank_bm25 一样兜底为 EPSILON * 平均 idf
+        dff = df.astype(np.float64)
+        idf = np.log(n_docs - dff + 0.5) - np.log(dff + 0.5)
+        avg_idf = idf.mean() if len(idf) else 0.0
+        idf[idf < 0] = self.EPSILON * avg_idf
+        self._idf = idf.astype(np.float32)
+
+    # -------------------------------
+    # 磁盘缓存：corpus + 倒排索引整包落一个 .npz
+    # -------------------------------
+    def _cache_path(self, sig: int) -> str:
+        return os.path.join(BM25_CACHE_DIR, f"bm25_{sig}.npz")
+
+    def _load_cache(self, sig: int) -> bool:
+        path = self._cache_path(sig)
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as z:
+                self.corpus = _unpack_strings(z["corpus_blob"], z["corpus_offsets"])
+                self._corpus_np = np.asarray(self.corpus, dtype=object)
+                terms = _unpack_strings(z["vocab_blob"], z["vocab_offsets"])
+                self._vocab = {t: i for i, t in enumerate(terms)}
+                self._post_indptr = z["post_indptr"]
+                self._post_docs = z["post_docs"]
+                self._post_tfs = z["post_tfs"]
+                self._idf = z["idf"]
+                self._len_norm = z["len_norm"]
+            return True
+        except Exception as e:
+            print(f"⚠️ BM25 cache load failed, rebuilding: {e}")
+            return False
+
+    def _save_cache(self, sig: int) -> None:
+        try:
+            os.makedirs(BM25_CACHE_DIR, exist_ok=True)
+            corpus_blob, corpus_offsets = _pack_strings(self.corpus)
+            # vocab 按 term id 顺序展平，加载时恢复成 dict
+            terms = list(self._vocab)
+            vocab_blob, vocab_offsets = _pack_strings(terms)
+            np.savez(
+                self._cache_path(sig),
+                corpus_blob=corpus_blob,
+                corpus_offsets=corpus_offsets,
+                vocab_blob=vocab_blob,
+                vocab_offsets=vocab_offsets,
+                post_indptr=self._post_indptr,
+                post_docs=self._post_docs,
+                post_tfs=self._post_tfs,
+                idf=self._idf,
+                len_norm=self._len_norm,
+            )
+        except Exception as e:
+            # 缓存写失败不致命，下次启动重建即可
+            print(f"⚠️ BM25 cache save failed: {e}")
 
     def _load_corpus(self):
         """
         读取所有 chunks 的 meta.text 字段作为 BM25 的 corpus。
+        热启动路径：collection 行数做签名，命中 bm25_cache/<sig>.npz 时
+        直接加载现成的 corpus + 倒排索引，跳过全量 Milvus 拉取和分词重建。
+        双检锁：并发首调只有一个线程真正构建。
         """
         if self._initialized:
             return
+        with self._load_lock:
+            self._load_corpus_locked()
+
+    def _load_corpus_locked(self):
+        if self._initialized:
+            return
+        try:
+            # num_entities 只是一次 stats RPC，比全量 query 便宜得多。
+            # 注意：签名只看行数——等量替换行（删 N 插 N）时会命中旧缓存；
+            # 这种场景需手动清 bm25_cache/ 或换更强的签名（如 max pk + 行数）
+            sig = int(self.milvus._get_collection().num_entities)
+        except Exception as e:
+            print(f"⚠️ BM25 corpus load failed (Milvus unavailable): {e}")
+            self._initialized = True
+            return
+
+        if sig > 0 and self._load_cache(sig):
+            self._initialized = True
+            return
+
         try:
             rows = self.milvus.fetch_all_documents()
         except Exception as e:
             print(f"⚠️ BM25 corpus load failed (Milvus unavailable): {e}")
-            self.bm25 = None
             self._initialized = True
             return
         self.corpus: list[str] = [
@@ -44,12 +201,14 @@ class BM25Retriever:
 
         if not self.corpus:
             print("⚠️ BM25 corpus is empty. Skipping BM25 initialization.")
-            self.bm25 = None
             self._initialized = True
             return
 
+        self._corpus_np = np.asarray(self.corpus, dtype=object)
         tokenized = [doc.split() for doc in self.corpus]
-        self.bm25 = BM25Okapi(tokenized)
+        self._build_index(tokenized)
+        if sig > 0:
+            self._save_cache(sig)
         self._initialized = True
 
     def search(self, query: str, top_k: int = 5) -> list[dict[str, Any]]:
@@ -59,23 +218,34 @@ class BM25Retriever:
         with _tracer.start_as_current_span("bm25.search"):
             if not self._initialized:
                 self._load_corpus()
-            if self.bm25 is None:
+            if self._idf is None or not self._vocab:
                 return []
 
-            tokens = query.split()
-            scores = self.bm25.get_scores(tokens)
+            scores = np.zeros(len(self.corpus), dtype=np.float32)
+            k1p1 = self.K1 + 1.0
+            for tok in query.split():
+                ti = self._vocab.get(tok)
+                if ti is None:
+                    continue
+                s, e = self._post_indptr[ti], self._post_indptr[ti + 1]
+                docs = self._post_docs[s:e]
+                tf = self._post_tfs[s:e]
+                scores[docs] += self._idf[ti] * tf * k1p1 / (tf + self._len_norm[docs])
 
-            # 排序 (idx, score)
-            ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)[:top_k]
+            # top-k 选择：argpartition 先 O(N) 选出前 k，再只对 k 个排序，
+            # 替代整表 O(N log N) 全排序
+            if top_k >= len(scores):
+                idx = np.argsort(-scores, kind="stable")
+            else:
+                part = np.argpartition(-scores, top_k)[:top_k]
+                idx = part[np.argsort(-scores[part], kind="stable")]
 
-            results = []
-            for idx, score in ranked:
-                results.append(
-                    {
-                        "chunk_id": idx,
-                        "score": float(score),
-                        "text": self.corpus[idx],
-                    }
+            # 文本/分数各一次 fancy-index 取齐，循环里只剩 dict 组装
+            top_texts = self._corpus_np[idx]
+            top_scores = scores[idx]
+            return [
+                {"chunk_id": i, "score": s, "text": t}
+                for i, s, t in zip(
+                    idx.tolist(), top_scores.tolist(), top_texts.tolist(), strict=True
                 )
-
-            return results
+            ]
@@ -1,6 +1,8 @@
 # services/retriever/hybrid_retriever.py
 
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 from opentelemetry import trace
@@ -13,11 +15,21 @@ from services.retriever.vector_retriever import VectorRetriever
 _tracer = trace.get_tracer("hybrid-retriever")
 
 
+def _timed(fn, *args):
+    """执行并返回 (结果, 耗时ms)，给并行双路各自记时用"""
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, (time.perf_counter() - t0) * 1000.0
+
+
 class HybridRetriever:
     """
     Day 8: 双路检索 (Vector + BM25)
     Day 9: 将会加入 RRF 融合
     Day10: 可选 Rerank + 分页 + Debug
+
+    向量检索是 Milvus 网络 RPC、BM25 是本地 CPU 计算，两路互不依赖，
+    用常驻双线程池并行发出：双路耗时从 vector+bm25 降为 max(两者)。
     """
 
     def __init__(self):
@@ -26,6 +38,13 @@ class HybridRetriever:
         # RRF 融合超参数（常用缺省为 60）
         self.reranker = Reranker()
         self.rrf_k = 60
+        # 跨请求复用，避免每次 search 的线程创建开销。
+        # 池是进程级共享的，按并发容量配：每个 hybrid 请求占两个 leg，
+        # 默认 2 × AnyIO 线程池的 40，保证网关满并发时双路也不排队
+        workers = int(os.getenv("HYBRID_POOL_WORKERS", "80"))
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="hybrid"
+        )
 
     def search(
         self,
@@ -48,12 +67,14 @@ class HybridRetriever:
         - 分页
         """
         with _tracer.start_as_current_span("hybrid.search"):
-            t0 = time.time()
-            vec_res = self.vector.search(query, vector_k)
-            t1 = time.time()
-
-            bm25_res = self.bm25.search(query, bm25_k)
-            t2 = time.time()
+            t0 = time.perf_counter()
+            # 双路并行：任一路抛异常会在 result() 处重新抛出，
+            # 降级语义与原先顺序执行一致
+            f_vec = self._pool.submit(_timed, self.vector.search, query, vector_k)
+            f_bm25 = self._pool.submit(_timed, self.bm25.search, query, bm25_k)
+            vec_res, vector_ms = f_vec.result()
+            bm25_res, bm25_ms = f_bm25.result()
+            t2 = time.perf_counter()
 
             # RRF 融合（使用底层原始结果）
             fused_results = (
@@ -64,16 +85,16 @@ class HybridRetriever:
                 )
                 or []
             )
-            t3 = time.time()
+            t3 = time.perf_counter()
 
             # 只对前 top_k 个做 rerank / 分页
             candidates = fused_results[:top_k] if top_k > 0 else fused_results
             total_candidates = len(candidates)
 
             if rerank and candidates:
-                rerank_start = time.time()
+                rerank_start = time.perf_counter()
                 reranked_candidates = self.reranker.rerank(query, candidates)
-                rerank_end = rerank_start + (time.time() - rerank_start)
+                rerank_end = time.perf_counter()
             else:
                 rerank_start = rerank_end = t3
                 reranked_candidates = candidates
@@ -86,10 +107,12 @@ class HybridRetriever:
             else:
                 page_items = reranked_candidates[start:end]
 
-            # 构造延时信息
+            # 构造延时信息：vector/bm25 是各自线程内的耗时，
+            # parallel 是双路重叠后的实际墙钟
             latency_ms = {
-                "vector": round((t1 - t0) * 1000, 2),
-                "bm25": round((t2 - t1) * 1000, 2),
+                "vector": round(vector_ms, 2),
+                "bm25": round(bm25_ms, 2),
+                "parallel": round((t2 - t0) * 1000, 2),
                 "fusion": round((t3 - t2) * 1000, 2),
             }
 
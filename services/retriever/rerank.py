@@ -1,10 +1,22 @@
 # services/retriever/rerank.py
 
+import os
+import threading
+from collections import OrderedDict
 from typing import Any
 
 import numpy as np
 
 from libs.embedding.factory import get_embedding_model
+from libs.embedding.query_cache import embed_query_cached
+
+# 已归一化候选向量缓存：chunk 文本不可变，top-k 候选跨请求高度重复，
+# 命中即跳过整次 embedding 前向。LRU 上限可按内存调
+# （8192 × 768 维 float32 ≈ 24 MB）。
+# 不按 chunk_id 做定位缓存：chunk_id 是文档内编号，跨文档会撞行
+RERANK_VEC_CACHE_SIZE = int(os.getenv("RERANK_VEC_CACHE_SIZE", "8192"))
+_vec_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+_vec_cache_lock = threading.Lock()
 
 
 class Reranker:
@@ -13,6 +25,9 @@ class Reranker:
     - 使用 DummyEmbeddingModel（或实际 embedding 模型）对 query / chunk text 做 embed
     - 计算 cosine 相似度
     - 结合 BM25 / vector / RRF 的分数做归一化加权
+
+    候选整批走一次 embed_batch + 一次 (N, D) @ (D,) 矩阵乘得到全部 cosine，
+    替代逐候选 embed_one + 逐对 dot 的 Python 循环。
     """
 
     def __init__(
@@ -29,29 +44,29 @@ class Reranker:
         self.delta = delta
 
     @staticmethod
-    def _cosine(a: np.ndarray, b: np.ndarray) -> float:
-        a = np.asarray(a, dtype="float32")
-        b = np.asarray(b, dtype="float32")
-        na = np.linalg.norm(a)
-        nb = np.linalg.norm(b)
-        if na == 0.0 or nb == 0.0:
-            return 0.0
-        return float(a.dot(b) / (na * nb))
-
-    @staticmethod
-    def _normalize(scores: list[float]) -> list[float]:
-        """简单 min-max 归一化；None 视为 0。"""
-        vals = [s for s in scores if s is not None]
-        if not vals:
-            return [0.0 for _ in scores]
-
-        mn = min(vals)
-        mx = max(vals)
-        if abs(mx - mn) < 1e-9:
-            # 所有值相等时统一给一个中间值，避免全 0
-            return [0.5 if s is not None else 0.0 for s in scores]
-
-        return [(s - mn) / (mx - mn) if s is not None else 0.0 for s in scores]
+    def _minmax_columns(cols: np.ndarray) -> np.ndarray:
+        """
+        逐列 nan-aware min-max 归一化，四路分数一次矩阵操作走完：
+        缺失（nan）→ 0，常数列 → 0.5（避免全 0），全缺失列 → 0。
+        """
+        missing = np.isnan(cols)
+        valid_cols = np.nonzero(~missing.all(axis=0))[0]
+        out = np.zeros_like(cols)
+        if valid_cols.size == 0:
+            return out
+
+        mn = np.zeros(cols.shape[1])
+        mx = np.zeros(cols.shape[1])
+        mn[valid_cols] = np.nanmin(cols[:, valid_cols], axis=0)
+        mx[valid_cols] = np.nanmax(cols[:, valid_cols], axis=0)
+        rng = mx - mn
+        const = np.abs(rng) < 1e-9
+
+        normed = (cols - mn) / np.where(const, 1.0, rng)
+        normed = np.where(const, 0.5, normed)
+        normed[missing] = 0.0
+        out[:, valid_cols] = normed[:, valid_cols]
+        return out
 
     def rerank(
         self, query: str, candidates: list[dict[str, Any]]
@@ -65,68 +80,90 @@ class Reranker:
         if not candidates:
             return []
 
-        q_vec = self.model.embed_one(query)
-
-        cos_sims: list[float] = []
-        bm25_scores: list[float] = []
-        vec_scores: list[float] = []
-        rrf_scores: list[float] = []
-
-        # 逐个 chunk 计算 embedding + cosine
+        # ---- 取文本；空文本占位，cosine 置 0 ----
+        texts: list[str] = []
+        has_text: list[bool] = []
         for c in candidates:
             text = c.get("text")
             if not text:
                 meta = c.get("meta") or {}
                 if isinstance(meta, dict):
                     text = meta.get("text") or meta.get("content") or ""
-
-            if text:
-                c_vec = self.model.embed_one(text)
-                cos_val = self._cosine(q_vec, np.asarray(c_vec, dtype="float32"))
-            else:
-                cos_val = 0.0
-
-            cos_sims.append(cos_val)
-
-            bm25_scores.append(
-                c.get("score_bm25")
-                if c.get("score_bm25") is not None
-                else c.get("bm25_score")
-            )
-
-            vec_scores.append(
-                c.get("score_vector")
-                if c.get("score_vector") is not None
-                else (
-                    c.get("vector_score")
-                    if c.get("vector_score") is not None
-                    else c.get("score")
-                )  # 兜底：Milvus 原始 score
+            texts.append(text or "")
+            has_text.append(bool(text))
+
+        # ---- 一次 embed_batch + 单次 GEMV 算全部 cosine ----
+        # query 向量走共享缓存：hybrid 路径里 VectorRetriever 刚 embed 过同一条
+        q_vec = np.asarray(embed_query_cached(query), dtype=np.float32)
+        q_norm = np.linalg.norm(q_vec)
+        if q_norm > 0.0:
+            q_vec = q_vec / q_norm
+
+        # 候选向量先查缓存，缓存里的行已归一化；只有未命中的
+        # 才进一次 embed_batch，归一化后回填
+        with _vec_cache_lock:
+            rows: list[np.ndarray | None] = []
+            for t in texts:
+                vec = _vec_cache.get(t)
+                if vec is not None:
+                    _vec_cache.move_to_end(t)
+                rows.append(vec)
+
+        miss_idx = [i for i, r in enumerate(rows) if r is None]
+        if miss_idx:
+            fresh = np.asarray(
+                self.model.embed_batch([texts[i] for i in miss_idx]),
+                dtype=np.float32,
             )
-
-            rrf_scores.append(c.get("rrf_score"))
-
-        # 归一化各路分数
-        cos_norm = self._normalize(cos_sims)
-        bm25_norm = self._normalize(bm25_scores)
-        vec_norm = self._normalize(vec_scores)
-        rrf_norm = self._normalize(rrf_scores)
-
+            norms = np.linalg.norm(fresh, axis=1, keepdims=True)
+            norms[norms == 0.0] = 1.0
+            fresh /= norms
+            with _vec_cache_lock:
+                for j, i in enumerate(miss_idx):
+                    rows[i] = fresh[j]
+                    _vec_cache[texts[i]] = fresh[j]
+                while len(_vec_cache) > RERANK_VEC_CACHE_SIZE:
+                    _vec_cache.popitem(last=False)
+
+        mat = np.vstack(rows)
+        cos_sims = mat @ q_vec
+        cos_sims[~np.asarray(has_text)] = 0.0
+
+        # ---- 辅助分数一趟收集进 (N, 3) 矩阵，nan 表示缺失 ----
+        aux = np.full((len(candidates), 3), np.nan, dtype=np.float64)
+        for i, c in enumerate(candidates):
+            v = c.get("score_bm25")
+            if v is None:
+                v = c.get("bm25_score")
+            if v is not None:
+                aux[i, 0] = v
+
+            v = c.get("score_vector")
+            if v is None:
+                v = c.get("vector_score")
+            if v is None:
+                v = c.get("score")  # 兜底：Milvus 原始 score
+            if v is not None:
+                aux[i, 1] = v
+
+            v = c.get("rrf_score")
+            if v is not None:
+                aux[i, 2] = v
+
+        # ---- 归一化 + 加权融合成单个矩阵流水：
+        # cols = [cos, bm25, vec, rrf]，一次列归一化 + 一次 GEMV ----
+        cols = np.column_stack((cos_sims.astype(np.float64), aux))
+        normed = self._minmax_columns(cols)
+        weights = np.array([self.alpha, self.beta, self.gamma, self.delta])
+        scores = normed @ weights
+        cos_norm = normed[:, 0]
+
+        # 稳定降序：同分保持原序，与先前 list.sort 语义一致
+        order = np.argsort(-scores, kind="stable")
         reranked: list[dict[str, Any]] = []
-        for c, cs, nb, nv, nr in zip(
-            candidates,
-            cos_norm,
-            bm25_norm,
-            vec_norm,
-            rrf_norm,
-            strict=True,
-        ):
-            score = self.alpha * cs + self.beta * nb + self.gamma * nv + self.delta * nr
-            item = dict(c)
-            item["rerank_score"] = float(score)
-            item["score_rerank_cos"] = float(cs)
+        for i in order.tolist():
+            item = dict(candidates[i])
+            item["rerank_score"] = float(scores[i])
+            item["score_rerank_cos"] = float(cos_norm[i])
             reranked.append(item)
-
-        # 按 rerank_score 降序排序
-        reranked.sort(key=lambda x: x.get("rerank_score", 0.0), reverse=True)
         return reranked
@@ -1,6 +1,7 @@
 # services/retriever/vector_retriever.py
 
 import os
+import threading
 from typing import Any
 
 import numpy as np
@@ -8,9 +9,21 @@ from opentelemetry import trace
 
 from libs.db.milvus_client import MilvusClientFactory
 from libs.embedding.factory import get_embedding_model
+from libs.embedding.query_cache import embed_query_cached
 
 _tracer = trace.get_tracer("vector-retriever")
 
+# 每线程复用一个 query 向量缓冲区：维度固定，
+# 免去每次查询的 np.array 分配 + dtype 推断
+_TLS = threading.local()
+
+
+def _vec_buffer(dim: int) -> np.ndarray:
+    buf = getattr(_TLS, "buf", None)
+    if buf is None or buf.shape[0] != dim:
+        buf = _TLS.buf = np.empty(dim, dtype=np.float32)
+    return buf
+
 
 class VectorRetriever:
     """
@@ -28,10 +41,11 @@ class VectorRetriever:
 
     def search(self, query: str, top_k: int = 5) -> dict[str, Any]:
         with _tracer.start_as_current_span("vector.search"):
-            vec = self.model.embed_one(query)
-            results = self.factory.search_vectors(
-                np.array(vec, dtype="float32"), top_k=top_k
-            )
+            vec = embed_query_cached(query)
+            # 复制进预分配缓冲区：连续且对齐，Milvus 序列化可以直接用
+            buf = _vec_buffer(len(vec))
+            np.copyto(buf, vec, casting="unsafe")
+            results = self.factory.search_vectors(buf, top_k=top_k)
             return {
                 "query": query,
                 "model": self.model_name,
@@ -0,0 +1,11 @@
+# tests/test_api_gateway_routes.py
+from services.api_gateway.main import app
+
+
+def test_no_duplicate_routes():
+    # 防止历史上 sync/async 两份 main.py 合并后残留重复 handler：
+    # 每个核心路径只应注册一次
+    paths = [route.path for route in app.routes]
+    assert paths.count("/query") == 1
+    assert paths.count("/ingest") == 1
+    assert paths.count("/health") == 1
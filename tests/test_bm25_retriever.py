@@ -0,0 +1,118 @@
+# tests/test_bm25_retriever.py
+import math
+
+import numpy as np
+
+import services.retriever.bm25_retriever as bm25_module
+from services.retriever.bm25_retriever import BM25Retriever
+
+
+def _reference_okapi_scores(corpus: list[list[str]], query: list[str]) -> list[float]:
+    """
+    逐文档的纯 Python Okapi 打分，公式与 rank_bm25.BM25Okapi 一致
+    （含负 idf 的 EPSILON * avg_idf 兜底），作为 numpy 倒排实现的参照。
+    """
+    k1, b, epsilon = BM25Retriever.K1, BM25Retriever.B, BM25Retriever.EPSILON
+    n_docs = len(corpus)
+    doc_lens = [len(d) for d in corpus]
+    avgdl = sum(doc_lens) / n_docs
+
+    df: dict[str, int] = {}
+    for doc in corpus:
+        for term in set(doc):
+            df[term] = df.get(term, 0) + 1
+    idf = {t: math.log(n_docs - d + 0.5) - math.log(d + 0.5) for t, d in df.items()}
+    avg_idf = sum(idf.values()) / len(idf)
+    idf = {t: v if v >= 0 else epsilon * avg_idf for t, v in idf.items()}
+
+    scores = []
+    for doc, dl in zip(corpus, doc_lens, strict=True):
+        s = 0.0
+        for tok in query:
+            if tok not in idf:
+                continue
+            tf = doc.count(tok)
+            s += idf[tok] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        scores.append(s)
+    return scores
+
+
+def _build_retriever(corpus: list[str]) -> BM25Retriever:
+    """离线构建：跳过 Milvus 拉取，直接喂 corpus 建索引"""
+    r = BM25Retriever()
+    r.corpus = corpus
+    r._corpus_np = np.asarray(corpus, dtype=object)
+    r._build_index([doc.split() for doc in corpus])
+    r._initialized = True
+    return r
+
+
+def test_bm25_scores_match_okapi_reference():
+    corpus = [
+        "milvus is a vector database for embedding search",
+        "bm25 is a classic lexical ranking function",
+        "hybrid search fuses vector and bm25 results with rrf",
+        "the quick brown fox jumps over the lazy dog",
+        "vector search and bm25 search complement each other",
+    ]
+    query = "vector bm25 search"
+
+    r = _build_retriever(corpus)
+    hits = r.search(query, top_k=len(corpus))
+    expected = _reference_okapi_scores([doc.split() for doc in corpus], query.split())
+
+    # ✅ 每个文档的分数与参照实现一致（float32 舍入以内）
+    for hit in hits:
+        assert math.isclose(hit["score"], expected[hit["chunk_id"]], abs_tol=1e-4)
+        assert hit["text"] == corpus[hit["chunk_id"]]
+
+    # ✅ 排序即参照分数的降序
+    ref_order = sorted(range(len(corpus)), key=lambda i: -expected[i])
+    assert [h["chunk_id"] for h in hits] == ref_order
+
+
+def test_bm25_top_k_matches_full_sort():
+    corpus = [f"doc {i} term{i % 7} term{i % 3} shared" for i in range(50)]
+    r = _build_retriever(corpus)
+
+    full = r.search("shared term2 term5", top_k=len(corpus))
+    top = r.search("shared term2 term5", top_k=5)
+
+    # ✅ argpartition 路径的前 5 分数与全排序前 5 一致
+    # （同分文档在截断边界上的取舍可以不同，只要求分数序列相同）
+    assert [h["score"] for h in top] == [h["score"] for h in full[:5]]
+    full_by_id = {h["chunk_id"]: h["score"] for h in full}
+    for h in top:
+        assert h["score"] == full_by_id[h["chunk_id"]]
+
+
+def test_bm25_empty_corpus_returns_empty():
+    r = _build_retriever([])
+    # 全空文档同理：词表为空时不应产出零分的假命中
+    r2 = _build_retriever(["", "", ""])
+    assert r.search("anything") == []
+    assert r2.search("anything") == []
+
+
+def test_bm25_cache_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setattr(bm25_module, "BM25_CACHE_DIR", str(tmp_path))
+    corpus = [
+        "cache round trip should restore corpus and index",
+        "bm25 npz cache keyed by collection row count",
+        "stale cache is rebuilt when the signature changes",
+    ]
+    r = _build_retriever(corpus)
+    r._save_cache(sig=len(corpus))
+
+    fresh = BM25Retriever()
+    assert fresh._load_cache(sig=len(corpus))
+    fresh._initialized = True
+
+    # ✅ 加载后的索引与原索引打分完全一致
+    assert fresh.corpus == corpus
+    assert fresh.search("cache bm25 corpus", top_k=3) == r.search(
+        "cache bm25 corpus", top_k=3
+    )
+
+    # ✅ 不存在的签名不命中
+    assert not BM25Retriever()._load_cache(sig=999)
@@ -59,3 +59,18 @@ def test_empty_text():
     chunker = TextChunker(strategy="char", size=10, overlap=1)
     chunks = chunker.chunk("")
     assert chunks == []
+
+
+def test_count_matches_chunk():
+    texts = [
+        "",
+        "short",
+        "abcdefghijklmnopqrstuvwxyz" * 7,
+        "A. B? C! 这是中文。还有一段？",
+        "S1. S2. S3. S4. S5.\nS6! S7; S8.",
+    ]
+    for strategy in ("char", "sentence"):
+        for size, overlap in ((10, 2), (8, 0), (50, 10)):
+            chunker = TextChunker(strategy=strategy, size=size, overlap=overlap)
+            for txt in texts:
+                assert chunker.count(txt) == len(chunker.chunk(txt))